@@ -0,0 +1,43 @@
+import atexit
+import copy
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import django
+
+# benchmarks run on their own SQLite file next to this package, never on db.sqlite3. with
+# ZOOMBY_DB_PROFILE=postgres they use the ZOOMBY_DB_NAME database as configured
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+def log_to_temporary_directory(settings):
+    # the log files of a run go to a directory that is removed at exit, not into the repo's logs/
+    directory = tempfile.TemporaryDirectory(prefix='zoomby-bench-logs-')
+    config = copy.deepcopy(settings.LOGGING)
+    for handler in config['handlers'].values():
+        if 'filename' in handler:
+            handler['filename'] = os.path.join(directory.name, os.path.basename(handler['filename']))
+    settings.LOGGING = config
+
+    def cleanup():
+        # the handlers drain their queues and close the files first
+        logging.shutdown()
+        directory.cleanup()
+    atexit.register(cleanup)
+
+def setup(db_name='bench.sqlite3', migrate=True, **overrides):
+    # overrides replace settings before django is set up, e.g. CACHES=...
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zoomby.settings')
+    from django.conf import settings
+
+    log_to_temporary_directory(settings)
+    if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        settings.DATABASES['default']['NAME'] = BENCH_DIR / db_name
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
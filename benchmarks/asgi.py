@@ -0,0 +1,122 @@
+"""
+In-process load test of the read endpoints under WSGI and ASGI at the same
+concurrency: the sync DRF endpoints through the WSGI handler, the same DRF
+endpoints through the ASGI handler (one thread hop per request) and the
+native async views through the ASGI handler. Reports req/s, p50 and p99.
+
+    python -m benchmarks.asgi --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from benchmarks import setup
+
+HOST = 'localhost'
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def report(label, timings, elapsed):
+    print(
+        f'{label:<34} {len(timings) / elapsed:9.1f} req/s   '
+        f'p50 {statistics.median(timings) * 1000:7.2f} ms   p99 {percentile(timings, 0.99) * 1000:7.2f} ms'
+    )
+
+def run_wsgi(app, url, total, concurrency):
+    parts = urlsplit(url)
+
+    def call(_):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query,
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        started = time.perf_counter()
+        b''.join(app(environ, lambda status, headers, exc_info=None: None))
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(call, range(total)))
+    return timings, time.perf_counter() - started
+
+async def run_asgi(app, url, total, concurrency):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': parts.path, 'raw_path': parts.path.encode(), 'query_string': parts.query.encode(),
+        'root_path': '', 'headers': [(b'host', HOST.encode())], 'server': (HOST, 80), 'client': ('127.0.0.1', 5000),
+    }
+    timings = []
+    remaining = iter(range(total))
+
+    def receiver():
+        # the request body once, then nothing until the handler stops listening for a disconnect
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+        return receive
+
+    async def send(message):
+        pass
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await app(dict(scope), receiver(), send)
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--classes', type=int, default=500)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--no-cache', action='store_true', help='measure without the listing cache')
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.no_cache:
+        overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    setup('bench_asgi.sqlite3', **overrides)
+    from django.core.asgi import get_asgi_application
+    from django.core.wsgi import get_wsgi_application
+    from benchmarks.seed import seed
+    from core.models import Classes
+
+    if not args.reuse:
+        seed(classes=args.classes, bookings=args.bookings)
+    class_id = Classes.objects.values_list('id', flat=True).first()
+    email = 'client1@example.com'
+    scenarios = (
+        ('classes', '/core/api/v1.0/classes/?tz=Asia/Kolkata', '/core/api/v1.0/async/classes/?tz=Asia/Kolkata'),
+        ('class detail', f'/core/api/v1.0/classes/{class_id}/', f'/core/api/v1.0/async/classes/{class_id}/'),
+        ('bookings by email', f'/core/api/v1.0/bookings/?email={email}', f'/core/api/v1.0/async/bookings/?email={email}'),
+    )
+
+    wsgi_app = get_wsgi_application()
+    asgi_app = get_asgi_application()
+    print(f'{args.requests} requests per run, concurrency {args.concurrency}')
+    for name, sync_url, async_url in scenarios:
+        print(f'\n== {name}')
+        report('wsgi  drf view', *run_wsgi(wsgi_app, sync_url, args.requests, args.concurrency))
+        report('asgi  drf view (thread hop)', *asyncio.run(run_asgi(asgi_app, sync_url, args.requests, args.concurrency)))
+        report('asgi  async view', *asyncio.run(run_asgi(asgi_app, async_url, args.requests, args.concurrency)))
+
+if __name__ == '__main__':
+    main()
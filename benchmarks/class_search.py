@@ -0,0 +1,100 @@
+"""
+Query plans and timings of the class search filters before and after the
+0005_class_search_indexes migration, then GET /classes/?next_days=7 with and
+without the listing cache.
+
+    python -m benchmarks.class_search --classes 200000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+from benchmarks.indexes import measure
+
+BEFORE = '0004_class_booking_counters'
+AFTER = '0005_class_search_indexes'
+INSTRUCTORS = 50
+
+def spread_instructors():
+    # seed gives every class the same instructor
+    from django.contrib.auth.models import User
+    from django.db.models import F
+    from core.models import Classes
+
+    users = [User.objects.get_or_create(username=f'instructor{n}')[0] for n in range(INSTRUCTORS)]
+    for n, user in enumerate(users):
+        Classes.objects.annotate(bucket=F('id') % INSTRUCTORS).filter(bucket=n).update(instructor=user)
+    return users[INSTRUCTORS // 2]
+
+def query_shapes(instructor):
+    from django.http import QueryDict
+    from core.models import Activities, Classes
+    from core.views import parse_class_filters
+
+    activity = Activities.objects.order_by('id').values_list('id', flat=True)[5]
+
+    def search(query):
+        conditions, message = parse_class_filters(QueryDict(query))
+        assert message is None, message
+        return lambda: Classes.objects.filter(*conditions).order_by('delivery_date', 'id')[:51]
+
+    return {
+        'next 7 days': search('next_days=7'),
+        'inactive classes': search('is_active=false'),
+        'bookable now': search('bookable=true'),
+        'by activity': search(f'activities={activity}'),
+        'by instructor': search(f'instructor={instructor.pk}'),
+        'instructor, next 7 days': search(f'instructor={instructor.pk}&next_days=7'),
+    }
+
+def time_endpoint(client, url, repeat, clear):
+    from core.cache import get_cache
+
+    timings = []
+    for _ in range(repeat):
+        if clear:
+            get_cache().clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.content
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    args = parser.parse_args()
+
+    setup('bench_class_search.sqlite3')
+    from django.core.management import call_command
+    from django.test import Client
+    from benchmarks.seed import analyze, seed
+
+    call_command('migrate', 'core', BEFORE, verbosity=0)
+    if not args.reuse:
+        seed(classes=args.classes, bookings=0)
+    shapes = query_shapes(spread_instructors())
+    analyze()
+    before = measure(shapes, args.repeat)
+
+    call_command('migrate', 'core', AFTER, verbosity=0)
+    analyze()
+    after = measure(shapes, args.repeat)
+
+    for name in shapes:
+        print(f'\n== {name}')
+        for label, report in (('before', before), ('after', after)):
+            plan = report[name]['plan'].replace('\n', '\n' + ' ' * 26)
+            print(f'   {label:<6} {report[name]["median_ms"]:9.3f} ms   {plan}')
+
+    client = Client(HTTP_HOST='localhost')
+    url = '/core/api/v1.0/classes/?next_days=7'
+    print(f'\n== GET {url}')
+    print(f'   uncached {time_endpoint(client, url, args.repeat, clear=True):9.3f} ms')
+    print(f'   cached   {time_endpoint(client, url, args.repeat, clear=False):9.3f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Connection overhead and write concurrency of the database profiles
+(ZOOMBY_DB_PROFILE, see zoomby/databases.py). Every profile runs in its own
+process on its own database and requests go through the WSGI handler the way
+a threaded server calls it, so connections are closed or kept per
+CONN_MAX_AGE. The listing cache is off, every request reaches the database.
+
+  reads   GET /classes/{id}/ one at a time, the connection setup per request
+  writes  POST /book/ from --concurrency threads
+  mixed   the same writers plus as many threads reading /classes/
+
+Reports req/s, p50, p99 and failed requests (e.g. database is locked). The
+postgres profile runs when psycopg is installed and ZOOMBY_DB_NAME / USER /
+PASSWORD / HOST / PORT point at a database the benchmark may wipe.
+
+    python -m benchmarks.databases --requests 2000 --concurrency 8
+    python -m benchmarks.databases --profiles sqlite-wal postgres
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import count
+
+from benchmarks import setup
+
+HOST = 'localhost'
+PROFILES = ('sqlite', 'sqlite-wal', 'postgres')
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def report(label, timings, failed, elapsed):
+    print(
+        f'{label:<8} {len(timings) / elapsed:9.1f} req/s   p50 {statistics.median(timings) * 1000:7.2f} ms'
+        f'   p99 {percentile(timings, 0.99) * 1000:7.2f} ms   failed {failed}'
+    )
+
+def call(app, method, path, body=None):
+    # one request through the WSGI handler, closing the response is what lets django close the connection
+    data = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': BytesIO(data), 'wsgi.url_scheme': 'http', 'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    statuses = []
+    started = time.perf_counter()
+    response = app(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return time.perf_counter() - started, statuses[0]
+
+def run(jobs, concurrency):
+    # jobs are callables returning (seconds, status), run on concurrency threads
+    def attempt(job):
+        try:
+            return job()
+        except Exception:
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(attempt, jobs))
+    elapsed = time.perf_counter() - started
+    timings = [result[0] for result in results if result is not None]
+    failed = sum(1 for result in results if result is None or result[1] >= 500)
+    return timings, failed, elapsed
+
+def measure(profile, args):
+    setup(f'bench_db_{profile}.sqlite3', CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    from django.core.wsgi import get_wsgi_application
+    from benchmarks.seed import seed
+    from core.models import Classes
+
+    seed(activities=5, classes=50, bookings=1000, verbose=False)
+    Classes.objects.update(available_slots=10 ** 6)
+    class_ids = list(Classes.objects.values_list('id', flat=True))
+    app = get_wsgi_application()
+    numbers = count()
+    lock = threading.Lock()
+
+    def read():
+        return call(app, 'GET', f'/core/api/v1.0/classes/{class_ids[0]}/')
+
+    def write():
+        with lock:
+            n = next(numbers)
+        body = {'client_name': f'Client {n}', 'client_email': f'writer{n}@example.com', 'classes': class_ids[n % len(class_ids)]}
+        return call(app, 'POST', '/core/api/v1.0/book/', body)
+
+    print(f'\n== {profile}')
+    report('reads', *run([read] * args.requests, 1))
+    report('writes', *run([write] * args.requests, args.concurrency))
+    report('mixed', *run([write, read] * args.requests, args.concurrency * 2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=PROFILES)
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        measure(args.profile, args)
+        return
+
+    print(f'{args.requests} requests per run, concurrency {args.concurrency}')
+    for profile in args.profiles:
+        if profile == 'postgres' and (importlib.util.find_spec('psycopg') is None or 'ZOOMBY_DB_NAME' not in os.environ):
+            print(f'\n== {profile}\nskipped, needs psycopg and ZOOMBY_DB_NAME')
+            continue
+        # settings read the profile at import, so each one gets a fresh interpreter
+        command = [
+            sys.executable, '-m', 'benchmarks.databases', '--profile', profile,
+            '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+        ]
+        subprocess.run(command, env={**os.environ, 'ZOOMBY_DB_PROFILE': profile}, check=True)
+
+if __name__ == '__main__':
+    main()
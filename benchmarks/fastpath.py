@@ -0,0 +1,69 @@
+"""
+List serialization throughput, the regular ModelSerializer path (instances
+with the activities prefetch) against the .values() fast path, query
+included, for classes with and without ?tz= and for bookings.
+
+    python -m benchmarks.fastpath --rows 10000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+
+def median_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    args = parser.parse_args()
+
+    setup('bench_fastpath.sqlite3')
+    from django.db.models import Prefetch
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from benchmarks.seed import seed
+    from core.fastpath import BookingsValuesSerializer, ClassesValuesSerializer
+    from core.models import Activities, Bookings, Classes
+    from core.serializers import BookingsSerializer, ClassesSerializer
+
+    if not args.reuse:
+        seed(classes=args.rows, bookings=args.rows)
+    factory = APIRequestFactory()
+    classes = Classes.objects.prefetch_related(Prefetch('activities', queryset=Activities.objects.only('id').order_by('id')))
+    cases = (
+        ('classes', {}, classes, ClassesSerializer, ClassesValuesSerializer),
+        ('classes', {'tz': 'Asia/Kolkata'}, classes, ClassesSerializer, ClassesValuesSerializer),
+        ('bookings', {}, Bookings.objects.all(), BookingsSerializer, BookingsValuesSerializer),
+    )
+
+    for name, params, queryset, serializer_class, values_serializer_class in cases:
+        queryset = queryset.order_by('id')[:args.rows]
+
+        def regular():
+            context = {'request': Request(factory.get('/', params))}
+            return serializer_class(list(queryset), many=True, context=context).data
+
+        def fast():
+            values_serializer = values_serializer_class(context={'request': Request(factory.get('/', params))})
+            return values_serializer.serialize(queryset.prefetch_related(None).values(*values_serializer.columns()))
+
+        rows = len(regular())
+        slow_time = median_time(regular, args.repeat)
+        fast_time = median_time(fast, args.repeat)
+        label = f'{name} {" ".join(f"{key}={value}" for key, value in params.items())}'
+        print(
+            f'{label:<24} regular {rows / slow_time:>9,.0f} rows/s   values {rows / fast_time:>9,.0f} rows/s'
+            f'   {slow_time / fast_time:4.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Query plans and timings of the hot lookup paths before and after the
+indexes of the 0002_indexes_for_hot_lookups migration. The data is seeded on
+the current schema, the migration's indexes are dropped for the before run
+and created again for the after run.
+
+    python -m benchmarks.indexes --bookings 1000000
+"""
+import argparse
+import importlib
+import statistics
+import time
+
+from benchmarks import setup
+
+MIGRATION = '0002_indexes_for_hot_lookups'
+
+def set_indexes(migration, present):
+    # drop or create the indexes a core migration adds (AddIndex and raw CREATE INDEX), the seeders write
+    # through the current models so the schema itself has to stay at the latest migration
+    from django.apps import apps
+    from django.db import connection, migrations
+
+    operations = importlib.import_module(f'core.migrations.{migration}').Migration.operations
+    with connection.schema_editor() as editor:
+        for operation in operations:
+            if isinstance(operation, migrations.AddIndex):
+                model = apps.get_model('core', operation.model_name)
+                if present:
+                    editor.add_index(model, operation.index)
+                else:
+                    editor.remove_index(model, operation.index)
+            elif isinstance(operation, migrations.RunSQL):
+                editor.execute(operation.sql if present else operation.reverse_sql)
+
+def query_shapes():
+    from django.utils import timezone
+    from core.models import Bookings, Classes
+
+    now = timezone.now()
+    email = 'client1234@example.com'
+    class_id = Classes.objects.order_by('id').values_list('id', flat=True)[Classes.objects.count() // 2]
+    return {
+        'bookings by email': lambda: Bookings.objects.filter(client_email=email).order_by('created_at', 'id')[:51],
+        'bookings page': lambda: Bookings.objects.order_by('created_at', 'id')[:51],
+        'classes page': lambda: Classes.objects.order_by('delivery_date', 'id')[:51],
+        'active upcoming classes': lambda: Classes.objects.filter(is_active=True, delivery_date__gte=now).order_by('delivery_date', 'id')[:51],
+        'bookable classes': lambda: Classes.objects.filter(is_active=True, cutoff_date__gt=now),
+        'booked seats in class': lambda: Bookings.objects.filter(classes_id=class_id, is_active=True, is_waitlisted=False),
+    }
+
+def measure(shapes, repeat):
+    report = {}
+    for name, build in shapes.items():
+        queryset = build()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        report[name] = {'plan': queryset.explain(), 'median_ms': statistics.median(timings)}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--classes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    args = parser.parse_args()
+
+    setup('bench_indexes.sqlite3')
+    from benchmarks.seed import analyze, seed
+
+    if not args.reuse:
+        seed(classes=args.classes, bookings=args.bookings)
+    shapes = query_shapes()
+    set_indexes(MIGRATION, present=False)
+    try:
+        analyze()
+        before = measure(shapes, args.repeat)
+    finally:
+        set_indexes(MIGRATION, present=True)
+    analyze()
+    after = measure(shapes, args.repeat)
+
+    for name in shapes:
+        print(f'\n== {name}')
+        for label, report in (('before', before), ('after', after)):
+            plan = report[name]['plan'].replace('\n', '\n' + ' ' * 26)
+            print(f'   {label:<6} {report[name]["median_ms"]:9.3f} ms   {plan}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+POST /book/ latency with the file handlers written on the request thread
+(plain RotatingFileHandler) against the QueuedHandler pipeline of
+settings.LOGGING. Logs go to a temporary directory, --max-bytes makes them
+rotate often and --stall-ms / --stall-every make every Nth write sleep, the
+way a slow disk or a rotation does. Reports p50, p99 and max per mode.
+
+    python -m benchmarks.logging_latency --requests 2000 --stall-ms 50 --stall-every 200
+"""
+import argparse
+import copy
+import statistics
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from benchmarks import setup
+
+class StallingFileHandler(RotatingFileHandler):
+    # RotatingFileHandler that sleeps on every Nth record
+    def __init__(self, stall_seconds=0, stall_every=0, **kwargs):
+        super().__init__(**kwargs)
+        self.stall_seconds = stall_seconds
+        self.stall_every = stall_every
+        self.written = 0
+
+    def emit(self, record):
+        self.written += 1
+        if self.stall_every and self.written % self.stall_every == 0:
+            time.sleep(self.stall_seconds)
+        super().emit(record)
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def logging_config(base, directory, queued, max_bytes, stall_seconds, stall_every):
+    # settings.LOGGING with the files moved to directory, either queued or written by the request thread
+    config = copy.deepcopy(base)
+    for handler in config['handlers'].values():
+        if 'filename' not in handler:
+            continue
+        handler['filename'] = str(Path(directory) / Path(handler['filename']).name)
+        handler['maxBytes'] = max_bytes
+        handler['stall_seconds'] = stall_seconds
+        handler['stall_every'] = stall_every
+        handler.pop('handler_class', None)
+        handler.pop('queue_size', None)
+        if queued:
+            handler['class'] = 'core.logs.QueuedHandler'
+            handler['handler_class'] = 'benchmarks.logging_latency.StallingFileHandler'
+        else:
+            handler['class'] = 'benchmarks.logging_latency.StallingFileHandler'
+    return config
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--max-bytes', type=int, default=256 * 1024)
+    parser.add_argument('--stall-ms', type=float, default=0)
+    parser.add_argument('--stall-every', type=int, default=200)
+    args = parser.parse_args()
+
+    setup('bench_logging.sqlite3')
+    import logging.config
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import reverse
+    from benchmarks.seed import seed
+    from core.models import Classes
+
+    client = Client(HTTP_HOST='localhost')
+    url = reverse('core:book-list')
+    base = copy.deepcopy(settings.LOGGING)
+
+    for label, queued in (('request thread', False), ('queued', True)):
+        seed(activities=5, classes=20, bookings=0, verbose=False)
+        Classes.objects.update(available_slots=10 ** 6)
+        class_ids = list(Classes.objects.values_list('id', flat=True))
+        with tempfile.TemporaryDirectory() as directory:
+            stall_every = args.stall_every if args.stall_ms else 0
+            logging.config.dictConfig(logging_config(base, directory, queued, args.max_bytes, args.stall_ms / 1000, stall_every))
+            timings = []
+            for n in range(args.requests):
+                payload = {
+                    'client_name': f'Client {n}',
+                    'client_email': f'client{n}@example.com',
+                    'classes': class_ids[n % len(class_ids)],
+                }
+                started = time.perf_counter()
+                response = client.post(url, payload, content_type='application/json')
+                timings.append(time.perf_counter() - started)
+                assert response.status_code == 201, response.content
+            # drain and close the handlers before the directory goes away
+            logging.config.dictConfig({'version': 1, 'disable_existing_loggers': False})
+        print(
+            f'{label:<16} p50 {statistics.median(timings) * 1000:7.2f} ms   p99 {percentile(timings, 0.99) * 1000:7.2f} ms'
+            f'   max {max(timings) * 1000:7.2f} ms'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+JSON render and parse time of class list payloads, DRF's JSONRenderer /
+JSONParser against the orjson backed FastJSONRenderer / FastJSONParser.
+The payload is ClassesSerializer output with ?tz= (every row carries the
+local dates and the server values), the serializer time is printed too
+for scale.
+
+    python -m benchmarks.renderers --sizes 20 100 1000 10000 100000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+
+def median_time(func, repeat):
+    # small pages take microseconds, each sample runs enough calls to last about 50ms
+    started = time.perf_counter()
+    func()
+    loops = max(1, int(0.05 / max(time.perf_counter() - started, 1e-6)))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    args = parser.parse_args()
+
+    setup('bench_renderers.sqlite3')
+    from io import BytesIO
+    from django.db.models import Prefetch
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from benchmarks.seed import seed
+    from core import renderers
+    from core.models import Activities, Classes
+    from core.parsers import FastJSONParser
+    from core.renderers import FastJSONRenderer
+    from core.serializers import ClassesSerializer
+
+    if renderers.orjson is None:
+        print('orjson is not installed, FastJSONRenderer falls back to JSONRenderer')
+    if not args.reuse:
+        seed(classes=max(args.sizes), bookings=0)
+    queryset = Classes.objects.prefetch_related(Prefetch('activities', queryset=Activities.objects.only('id')))
+    request = Request(APIRequestFactory().get('/', {'tz': 'Asia/Kolkata'}))
+
+    print(f'{"rows":>8} {"serialize":>10} {"render drf":>11} {"render fast":>12} {"x":>5} {"parse drf":>10} {"parse fast":>11} {"x":>5} {"MB":>6}')
+    for size in args.sizes:
+        rows = list(queryset.order_by('id')[:size])
+        serialize = median_time(lambda: ClassesSerializer(rows, many=True, context={'request': request}).data, 1)
+        data = {'results': ClassesSerializer(rows, many=True, context={'request': request}).data}
+
+        body = JSONRenderer().render(data)
+        assert FastJSONRenderer().render(data) == body
+        render_drf = median_time(lambda: JSONRenderer().render(data), args.repeat)
+        render_fast = median_time(lambda: FastJSONRenderer().render(data), args.repeat)
+        parse_drf = median_time(lambda: JSONParser().parse(BytesIO(body)), args.repeat)
+        parse_fast = median_time(lambda: FastJSONParser().parse(BytesIO(body)), args.repeat)
+
+        print(
+            f'{len(rows):>8} {serialize * 1000:>8.2f}ms {render_drf * 1000:>9.3f}ms {render_fast * 1000:>10.3f}ms '
+            f'{render_drf / render_fast:>5.1f} {parse_drf * 1000:>8.3f}ms {parse_fast * 1000:>9.3f}ms '
+            f'{parse_drf / parse_fast:>5.1f} {len(body) / 1e6:>6.2f}'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Activities, Bookings, Classes
+from core.reservations import reconcile_counters
+
+# synthetic data generator, rows go in with bulk_create so Bookings.save (and the seat claim) is skipped
+# and slots / waitlist flags are set directly
+
+BATCH_SIZE = 10000
+BOOKINGS_PER_EMAIL = 5
+
+def reset():
+    with transaction.atomic():
+        Bookings.objects.all().delete()
+        Classes.objects.all().delete()
+        Activities.objects.all().delete()
+
+def get_user():
+    user = User.objects.filter(is_superuser=True).first()
+    if user is None:
+        user = User.objects.create_superuser(username='bench', email='bench@example.com', password='bench')
+    return user
+
+def analyze():
+    # refresh planner statistics after a bulk load
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+def seed(activities=50, classes=2000, bookings=1000000, seed_value=42, verbose=True):
+    # N activities, classes spread over the last and next 90 days with ~10% inactive, and bookings spread
+    # over the classes with every client email holding a handful of bookings
+    rng = random.Random(seed_value)
+    user = get_user()
+    now = timezone.now()
+    started = time.perf_counter()
+    reset()
+
+    with transaction.atomic():
+        activity_rows = Activities.objects.bulk_create([
+            Activities(name=f'Activity {i}', description='Synthetic activity', created_by=user, updated_by=user)
+            for i in range(activities)
+        ], batch_size=BATCH_SIZE)
+
+        class_rows = []
+        for i in range(classes):
+            delivery = now + timedelta(minutes=rng.randint(-90 * 24 * 60, 90 * 24 * 60))
+            class_rows.append(Classes(
+                name=f'Class {i}',
+                description='Synthetic class',
+                delivery_date=delivery,
+                cutoff_date=delivery - timedelta(hours=rng.randint(1, 72)),
+                allow_waitlist=rng.random() < 0.5,
+                instructor=user,
+                available_slots=rng.randint(5, 50),
+                is_active=rng.random() > 0.1,
+                created_by=user,
+                updated_by=user
+            ))
+        class_rows = Classes.objects.bulk_create(class_rows, batch_size=BATCH_SIZE)
+
+        through = Classes.activities.through
+        through.objects.bulk_create([
+            through(classes_id=class_obj.id, activities_id=activity.id)
+            for class_obj in class_rows
+            for activity in rng.sample(activity_rows, min(3, len(activity_rows)))
+        ], batch_size=BATCH_SIZE)
+
+    class_ids = [class_obj.id for class_obj in class_rows]
+    batch = []
+    for n in range(bookings):
+        # (email, class) stays unique: every email books BOOKINGS_PER_EMAIL consecutive classes
+        email_number, offset = divmod(n, BOOKINGS_PER_EMAIL)
+        class_id = class_ids[(email_number * BOOKINGS_PER_EMAIL + offset) % len(class_ids)]
+        batch.append(Bookings(
+            client_name=f'Client {email_number}',
+            client_email=f'client{email_number}@example.com',
+            classes_id=class_id,
+            is_active=rng.random() > 0.05,
+            is_waitlisted=rng.random() < 0.1,
+            created_by=user,
+            updated_by=user
+        ))
+        if len(batch) >= BATCH_SIZE:
+            with transaction.atomic():
+                Bookings.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        with transaction.atomic():
+            Bookings.objects.bulk_create(batch)
+    # the per class counters are recomputed once instead of per insert
+    reconcile_counters()
+
+    analyze()
+
+    if verbose:
+        elapsed = time.perf_counter() - started
+        print(f'seeded {activities} activities, {classes} classes, {bookings} bookings in {elapsed:.1f}s')
+    return class_ids
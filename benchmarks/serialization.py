@@ -0,0 +1,63 @@
+"""
+ClassesSerializer time per 10k classes, with and without ?tz=, against the
+old behaviour that resolved the timezone and server values on every row.
+
+    python -m benchmarks.serialization --classes 10000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    args = parser.parse_args()
+
+    setup('bench_serialization.sqlite3')
+    import pytz
+    from django.db.models import Prefetch
+    from django.utils import timezone
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from benchmarks.seed import seed
+    from core.models import Activities, Classes
+    from core.serializers import ClassesSerializer
+
+    class PerRowClassesSerializer(ClassesSerializer):
+        # the timezone and server values resolved on every row, as before
+        def get_timezone(self):
+            request = self.context.get('request')
+            tzname = request.query_params.get('tz') if request else None
+            try:
+                return pytz.timezone(tzname) if tzname else timezone.get_current_timezone()
+            except pytz.UnknownTimeZoneError:
+                return timezone.get_current_timezone()
+
+        def get_server_timezone(self, obj):
+            return str(timezone.get_current_timezone())
+
+        def get_server_time(self, obj):
+            return timezone.now().isoformat()
+
+    if not args.reuse:
+        seed(classes=args.classes, bookings=0)
+    rows = list(Classes.objects.prefetch_related(Prefetch('activities', queryset=Activities.objects.only('id'))))
+    factory = APIRequestFactory()
+
+    for label, params in (('no tz', {}), ('tz=Asia/Kolkata', {'tz': 'Asia/Kolkata'})):
+        for name, serializer_class in (('per row', PerRowClassesSerializer), ('per request', ClassesSerializer)):
+            timings = []
+            for _ in range(args.repeat):
+                request = Request(factory.get('/', params))
+                started = time.perf_counter()
+                serializer_class(rows, many=True, context={'request': request}).data
+                timings.append(time.perf_counter() - started)
+            per_10k = statistics.median(timings) / len(rows) * 10000 * 1000
+            print(f'{label:<16} {name:<12} {per_10k:9.1f} ms / 10k classes')
+
+if __name__ == '__main__':
+    main()
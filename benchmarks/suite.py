@@ -0,0 +1,364 @@
+"""
+Load test of the booking API: seeds N activities, classes and bookings,
+runs scripted scenarios at a given concurrency and reports req/s,
+p50 / p95 / p99 and database queries per request (taken from /metrics).
+
+Scenarios:
+  browse        the first pages of /classes/
+  browse-tz     the same pages with ?tz=Asia/Kolkata
+  by-email      /bookings/?email= for random clients
+  storm         concurrent POST /book/ on one hot class with few seats,
+                checks that the class isn't oversold
+  bulk-import   POST /book/bulk/ with 50 new bookings each
+
+Requests go through the in-process test client by default, or to a running
+server with --url (seed the server's database with --database, which wipes
+its activities, classes and bookings, or pass --reuse). --save writes the
+results as a JSON baseline and --compare diffs a run against one, exiting
+with 1 when a scenario regressed by more than --tolerance.
+
+    python -m benchmarks.suite --requests 500 --concurrency 8 --save
+    python -m benchmarks.suite --requests 500 --concurrency 8 --compare benchmarks/baselines/<commit>.json
+    python -m benchmarks.suite --url http://localhost:8000 --database db.sqlite3 --scenarios browse storm
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from benchmarks import BENCH_DIR, setup
+
+API = '/core/api/v1.0'
+BASELINE_DIR = BENCH_DIR / 'baselines'
+BROWSE_PAGES = 10
+BULK_SIZE = 50
+HOST = 'localhost'
+
+
+class InProcess:
+    # the Django test client, one per thread
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        from django.test import Client
+
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client(HTTP_HOST=HOST)
+        if method == 'GET':
+            response = self.local.client.get(path)
+        else:
+            response = self.local.client.post(path, json.dumps(body), content_type='application/json')
+        return response.status_code, response.content
+
+
+class Remote:
+    # a running server, one keep-alive connection per thread
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port, self.prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        for attempt in range(2):
+            if not hasattr(self.local, 'connection'):
+                self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            try:
+                self.local.connection.request(
+                    method, self.prefix + path, json.dumps(body) if body is not None else None, headers
+                )
+                response = self.local.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # the server closed the kept alive connection, retry once on a new one
+                self.local.connection.close()
+                del self.local.connection
+                if attempt:
+                    raise
+
+
+def query_totals(transport):
+    # {view: (queries, requests)} from the Prometheus text of /metrics, None when metrics are off
+    status, body = transport.request('GET', '/metrics')
+    if status != 200:
+        return None
+    totals = {}
+    for line in body.decode().splitlines():
+        for suffix, position in (('_sum', 0), ('_count', 1)):
+            name = f'zoomby_request_db_queries{suffix}{{'
+            if line.startswith(name):
+                labels, value = line[len(name):].rsplit('} ', 1)
+                view = labels.split('view="', 1)[1].split('"', 1)[0]
+                entry = totals.setdefault(view, [0.0, 0])
+                entry[position] += float(value)
+    return totals
+
+def queries_per_request(before, after):
+    if before is None or after is None:
+        return None
+    queries = requests = 0
+    for view, (total, count) in after.items():
+        if view == 'metrics':
+            continue
+        previous_total, previous_count = before.get(view, (0.0, 0))
+        queries += total - previous_total
+        requests += count - previous_count
+    return round(queries / requests, 2) if requests else None
+
+
+class Scenario:
+    name = None
+    # read only scenarios get warm up requests, which aren't measured
+    warmup = True
+
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+
+    def prepare(self, transport):
+        pass
+
+    def request(self, n):
+        raise NotImplementedError
+
+    def ok(self, status):
+        return 200 <= status < 300
+
+    def check(self):
+        return {}
+
+
+class Browse(Scenario):
+    name = 'browse'
+    params = ''
+
+    def prepare(self, transport):
+        # walk the first pages once, the runs then spread over them
+        self.paths = []
+        path = f'{API}/classes/?page_size=50{self.params}'
+        while path and len(self.paths) < BROWSE_PAGES:
+            self.paths.append(path)
+            status, body = transport.request('GET', path)
+            following = json.loads(body).get('next') if status == 200 else None
+            path = following[following.index(API):] if following else None
+
+    def request(self, n):
+        return 'GET', self.paths[n % len(self.paths)], None
+
+
+class BrowseTimezone(Browse):
+    name = 'browse-tz'
+    params = '&tz=Asia/Kolkata'
+
+
+class BookingsByEmail(Scenario):
+    name = 'by-email'
+
+    def prepare(self, transport):
+        from benchmarks.seed import BOOKINGS_PER_EMAIL
+
+        clients = max(1, self.args.bookings // BOOKINGS_PER_EMAIL)
+        self.emails = [f'client{self.rng.randrange(clients)}@example.com' for _ in range(self.args.requests)]
+
+    def request(self, n):
+        return 'GET', f'{API}/bookings/?email={self.emails[n]}', None
+
+
+class Storm(Scenario):
+    name = 'storm'
+    warmup = False
+
+    def prepare(self, transport):
+        # one class with a handful of seats and a waitlist, every request books it with a new email
+        from django.utils import timezone as django_timezone
+        from core.models import Bookings, Classes
+        from core.reservations import reconcile_counters
+
+        self.class_id = Classes.objects.order_by('id').values_list('id', flat=True).first()
+        Bookings.objects.filter(classes_id=self.class_id).delete()
+        now = django_timezone.now()
+        Classes.objects.filter(pk=self.class_id).update(
+            available_slots=self.args.storm_seats, allow_waitlist=True, is_active=True,
+            cutoff_date=now + timedelta(days=30), updated_at=now,
+        )
+        reconcile_counters([self.class_id])
+        self.run_id = time.time_ns()
+
+    def request(self, n):
+        body = {'client_name': f'Storm {n}', 'client_email': f'storm-{self.run_id}-{n}@example.com', 'classes': self.class_id}
+        return 'POST', f'{API}/book/', body
+
+    def check(self):
+        from core.models import Bookings
+
+        bookings = Bookings.objects.filter(classes_id=self.class_id, is_active=True)
+        seated = bookings.filter(is_waitlisted=False).count()
+        return {
+            'seated': seated,
+            'waitlisted': bookings.filter(is_waitlisted=True).count(),
+            'oversold': seated > self.args.storm_seats,
+        }
+
+
+class BulkImport(Scenario):
+    name = 'bulk-import'
+    warmup = False
+
+    def prepare(self, transport):
+        from core.models import Classes
+
+        self.class_ids = list(Classes.objects.filter(is_active=True).values_list('id', flat=True))
+        self.run_id = time.time_ns()
+
+    def request(self, n):
+        items = [
+            {'client_name': f'Import {n}-{i}', 'client_email': f'import-{self.run_id}-{n}-{i}@example.com',
+             'classes': self.rng.choice(self.class_ids)}
+            for i in range(BULK_SIZE)
+        ]
+        return 'POST', f'{API}/book/bulk/', {'bookings': items}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (Browse, BrowseTimezone, BookingsByEmail, Storm, BulkImport)}
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run(scenario, transport, requests, concurrency, warmup):
+    scenario.prepare(transport)
+    calls = [scenario.request(n) for n in range(requests)]
+
+    def call(arguments):
+        started = time.perf_counter()
+        try:
+            status, _ = transport.request(*arguments)
+        except Exception:
+            status = 0
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if scenario.warmup:
+            list(pool.map(call, calls[:warmup]))
+        before = query_totals(transport)
+        started = time.perf_counter()
+        outcomes = list(pool.map(call, calls))
+        elapsed = time.perf_counter() - started
+    after = query_totals(transport)
+
+    timings = [timing for timing, _ in outcomes]
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status in outcomes if not scenario.ok(status)),
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(statistics.median(timings) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        'queries_per_request': queries_per_request(before, after),
+        **scenario.check(),
+    }
+
+def report(results):
+    print(f'{"scenario":<12} {"requests":>8} {"errors":>6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    for name, result in results.items():
+        queries = result['queries_per_request']
+        extra = ' '.join(f'{key}={value}' for key, value in result.items() if key in ('seated', 'waitlisted', 'oversold'))
+        print(
+            f'{name:<12} {result["requests"]:>8} {result["errors"]:>6} {result["rps"]:>8.1f} {result["p50_ms"]:>8.2f} '
+            f'{result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} {"-" if queries is None else queries:>8}  {extra}'
+        )
+
+def compare(results, baseline, tolerance):
+    # slower latency / throughput beyond the tolerance, any extra query or error and an oversold class regress
+    regressions = []
+    print(f'\ncompared with {baseline.get("commit") or "baseline"} ({baseline.get("created")})')
+    for name, result in results.items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            continue
+        for key, higher_is_worse in (('rps', False), ('p50_ms', True), ('p95_ms', True), ('p99_ms', True)):
+            change = (result[key] - old[key]) / old[key] if old[key] else 0
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            print(f'{name:<12} {key:<20} {old[key]:>10} -> {result[key]:<10} {change:+7.1%}{"  REGRESSION" if worse else ""}')
+            if worse:
+                regressions.append(f'{name} {key}')
+        for key in ('queries_per_request', 'errors'):
+            if old.get(key) is not None and result.get(key) is not None and result[key] > old[key]:
+                print(f'{name:<12} {key:<20} {old[key]:>10} -> {result[key]:<10}  REGRESSION')
+                regressions.append(f'{name} {key}')
+        if result.get('oversold'):
+            regressions.append(f'{name} oversold')
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=BENCH_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=50, help='unmeasured requests before a read scenario')
+    parser.add_argument('--activities', type=int, default=50)
+    parser.add_argument('--classes', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=50000)
+    parser.add_argument('--storm-seats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='base url of a running server instead of the in-process client')
+    parser.add_argument('--database', help='SQLite file to seed, the one the server uses with --url')
+    parser.add_argument('--reuse', action='store_true', help='keep the already seeded database')
+    parser.add_argument('--no-cache', action='store_true', help='run in-process without the listing cache')
+    parser.add_argument('--save', nargs='?', const='', help='write a JSON baseline, by default to benchmarks/baselines/<commit>.json')
+    parser.add_argument('--compare', help='JSON baseline to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown, default 10%%')
+    args = parser.parse_args()
+    if args.url and not args.database and not args.reuse:
+        parser.error('--url needs --database (the server\'s SQLite file, it gets reseeded) or --reuse')
+
+    overrides = {}
+    if args.no_cache:
+        overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    setup(Path(args.database).resolve() if args.database else 'bench_suite.sqlite3', **overrides)
+    from benchmarks.seed import seed
+
+    if not args.reuse:
+        seed(activities=args.activities, classes=args.classes, bookings=args.bookings, seed_value=args.seed)
+    transport = Remote(args.url) if args.url else InProcess()
+    rng = random.Random(args.seed)
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run(SCENARIOS[name](args, rng), transport, args.requests, args.concurrency, args.warmup)
+    report(results)
+
+    commit = git_commit()
+    if args.save is not None:
+        path = Path(args.save) if args.save else BASELINE_DIR / f'{commit or "baseline"}.json'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        config = {key: getattr(args, key) for key in ('requests', 'concurrency', 'warmup', 'activities', 'classes', 'bookings', 'storm_seats', 'url', 'no_cache')}
+        created = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        path.write_text(json.dumps({'commit': commit, 'created': created, 'config': config, 'scenarios': results}, indent=2))
+        print(f'\nsaved {path}')
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print(f'\nregressed: {", ".join(regressions)}')
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
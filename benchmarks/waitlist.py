@@ -0,0 +1,64 @@
+"""
+Waitlist promotion on classes with long waitlists: every class gets
+--waitlisted waitlisted bookings, then --seats more seats, and all classes
+are promoted in one batch. Prints the plan of the per class waitlist read
+and the promotion time.
+
+    python -m benchmarks.waitlist --classes 20 --waitlisted 10000 --seats 1000
+"""
+import argparse
+import time
+
+from benchmarks import setup
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--waitlisted', type=int, default=10000)
+    parser.add_argument('--seats', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup('bench_waitlist.sqlite3')
+    from django.db import transaction
+    from benchmarks.seed import BATCH_SIZE, analyze, get_user, seed
+    from core.models import Bookings, Classes
+    from core.reservations import promote_waitlists, reconcile_counters
+
+    seed(classes=args.classes, bookings=0)
+    user = get_user()
+    class_ids = list(Classes.objects.values_list('id', flat=True))
+    Classes.objects.update(available_slots=0, allow_waitlist=True, is_active=True)
+
+    started = time.perf_counter()
+    for class_id in class_ids:
+        with transaction.atomic():
+            Bookings.objects.bulk_create([
+                Bookings(
+                    client_name=f'Client {n}',
+                    client_email=f'client{n}@example.com',
+                    classes_id=class_id,
+                    is_waitlisted=True,
+                    created_by=user,
+                    updated_by=user
+                )
+                for n in range(args.waitlisted)
+            ], batch_size=BATCH_SIZE)
+    reconcile_counters()
+    analyze()
+    print(f'waitlisted {args.waitlisted} bookings in each of {len(class_ids)} classes in {time.perf_counter() - started:.1f}s')
+
+    waiting = (
+        Bookings.objects.filter(classes_id=class_ids[0], is_active=True, is_waitlisted=True)
+        .order_by('created_at', 'id').values_list('id', flat=True)[:args.seats]
+    )
+    print(f'waitlist read plan: {waiting.explain()}')
+
+    Classes.objects.update(available_slots=args.seats)
+    started = time.perf_counter()
+    promoted = promote_waitlists(class_ids)
+    elapsed = time.perf_counter() - started
+    total = sum(promoted.values())
+    print(f'promoted {total} bookings in {len(promoted)} classes in {elapsed * 1000:.1f} ms ({total / elapsed:,.0f} bookings/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# who goes into created_by / updated_by. a request's authenticated user, otherwise the service account: the
+# user SERVICE_ACCOUNT_ID points at, or the first superuser when it isn't set. the service account is kept
+# per process, so the audit fields of a booking cost no query. it is dropped when a User is saved or deleted
+# here and after SERVICE_ACCOUNT_CACHE_TIMEOUT seconds, which bounds how long a change made by another
+# process goes unseen. a user read inside a transaction may still be rolled back and isn't kept
+
+MISSING = object()
+
+
+class ServiceAccount:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.user = MISSING
+        self.expires_at = 0
+
+    def load(self):
+        account_id = getattr(settings, 'SERVICE_ACCOUNT_ID', None)
+        if account_id is not None:
+            return User.objects.filter(pk=account_id).first()
+        return User.objects.filter(is_superuser=True).first()
+
+    def get(self):
+        user = self.user
+        if user is not MISSING and time.monotonic() < self.expires_at:
+            return user
+        generation = self.generation
+        user = self.load()
+        in_transaction = transaction.get_connection(router.db_for_read(User)).in_atomic_block
+        with self.lock:
+            # a user saved meanwhile may have changed the answer
+            if generation == self.generation and not in_transaction:
+                self.user = user
+                self.expires_at = time.monotonic() + getattr(settings, 'SERVICE_ACCOUNT_CACHE_TIMEOUT', 300)
+        return user
+
+    def forget(self):
+        with self.lock:
+            self.generation += 1
+            self.user = MISSING
+
+
+service_account = ServiceAccount()
+
+def acting_user(request=None):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    return service_account.get()
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, **kwargs):
+    service_account.forget()
+
+@receiver(setting_changed)
+def service_account_setting_changed(setting, **kwargs):
+    if setting == 'SERVICE_ACCOUNT_ID':
+        service_account.forget()
@@ -0,0 +1,172 @@
+import asyncio
+import base64
+import json
+import logging
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.validators import validate_email
+from django.db.models import Prefetch, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.request import Request
+from .availability import hub
+from .cache import CLASSES, aget_version, get_cache, response_key
+from .exports import format_datetime
+from .models import Activities, Bookings, Classes
+from .pagination import KeysetPagination
+from .serializers import BookingsSerializer, ClassesSerializer
+from .views import parse_class_filters, parse_class_ids, refresh_server_time
+
+# logger
+logger = logging.getLogger(__name__)
+
+STREAM_CLASS_LIMIT = 100
+
+# native async read path for ASGI deployments. these are plain Django async views (DRF views are sync
+# only): rows come from the async ORM, the listing cache is read and written with the async cache API and
+# the output is produced by the same serializers as the DRF endpoints. pages are forward only keyset
+# pages, ?cursor= carries the last (ordering value, id) of the previous page
+
+def class_queryset():
+    return Classes.objects.prefetch_related(Prefetch('activities', queryset=Activities.objects.only('id').order_by('id')))
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('page_size', KeysetPagination.page_size))
+    except ValueError:
+        size = KeysetPagination.page_size
+    return max(1, min(size, KeysetPagination.max_page_size))
+
+def encode_cursor(value, pk):
+    raw = json.dumps([format_datetime(value), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        moment = parse_datetime(value)
+    except (ValueError, TypeError):
+        return None
+    if moment is None or not isinstance(pk, int):
+        return None
+    return moment, pk
+
+def next_link(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+async def keyset_page(request, queryset, field):
+    # (field, id) > cursor, read with aiterator so rows stream from the database without a thread hop per row
+    size = page_size(request)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return None, None
+        value, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk}))
+
+    rows = [row async for row in queryset.order_by(field, 'id')[:size + 1].aiterator(chunk_size=size + 1)]
+    following = None
+    if len(rows) > size:
+        rows = rows[:size]
+        following = next_link(request, encode_cursor(getattr(rows[-1], field), rows[-1].pk))
+    return rows, following
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+async def class_list(request):
+    # same search params as the DRF listing, checked before the cache since they are part of its key
+    conditions, message = parse_class_filters(request.GET)
+    if message:
+        return error(message, 400)
+    drf_request = Request(request)
+    cache = get_cache()
+    key = response_key(CLASSES, drf_request, await aget_version(CLASSES))
+    data = await cache.aget(key)
+    if data is not None:
+        return JsonResponse(refresh_server_time(data))
+
+    rows, following = await keyset_page(request, class_queryset().filter(*conditions), 'delivery_date')
+    if rows is None:
+        return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+    data = {
+        'next': following,
+        'previous': None,
+        'results': ClassesSerializer(rows, many=True, context={'request': drf_request}).data,
+    }
+    await cache.aset(key, data, timeout=getattr(settings, 'LISTING_CACHE_TIMEOUT', 300))
+    return JsonResponse(data)
+
+async def class_detail(request, pk):
+    drf_request = Request(request)
+    cache = get_cache()
+    key = response_key(CLASSES, drf_request, await aget_version(CLASSES))
+    data = await cache.aget(key)
+    if data is not None:
+        return JsonResponse(refresh_server_time(data))
+
+    try:
+        classes = await class_queryset().aget(pk=pk)
+    except Classes.DoesNotExist:
+        return JsonResponse({'detail': 'No Classes matches the given query.'}, status=404)
+    data = ClassesSerializer(classes, context={'request': drf_request}).data
+    await cache.aset(key, data, timeout=getattr(settings, 'LISTING_CACHE_TIMEOUT', 300))
+    return JsonResponse(data)
+
+async def bookings_by_email(request):
+    email = request.GET.get('email')
+    if not email:
+        return error('email is required.', 400)
+    try:
+        validate_email(email)
+    except ValidationError:
+        logger.error(f"Invalid email Address {email}")
+        return error('Invalid email address.', 400)
+
+    bookings = Bookings.objects.filter(client_email=email)
+    if not await bookings.aexists():
+        return error('No bookings found for the given email.', 404)
+
+    rows, following = await keyset_page(request, bookings, 'created_at')
+    if rows is None:
+        return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+    return JsonResponse({
+        'next': following,
+        'previous': None,
+        'results': BookingsSerializer(rows, many=True, context={'request': Request(request)}).data,
+    })
+
+async def availability_events(class_ids):
+    # first event is the current state of every class, then one event per coalesced batch of changes.
+    # a comment line every heartbeat seconds keeps proxies from closing an idle connection
+    heartbeat = getattr(settings, 'AVAILABILITY_STREAM_HEARTBEAT', 15)
+    subscriber = await hub.subscribe(class_ids)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                rows = await subscriber.next(heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield f'event: availability\ndata: {json.dumps(rows)}\n\n'
+    finally:
+        hub.unsubscribe(subscriber)
+
+async def availability_stream(request):
+    # server-sent events with the seat counters of ?ids=1,2,3, replaces polling the class detail endpoint
+    if not isinstance(request, ASGIRequest):
+        return error('The availability stream is only served by the ASGI application.', 501)
+    class_ids, message = parse_class_ids(request.GET.get('ids', ''), STREAM_CLASS_LIMIT)
+    if message:
+        return error(message, 400)
+
+    response = StreamingHttpResponse(availability_events(class_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
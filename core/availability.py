@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from .models import Classes
+
+# logger
+logger = logging.getLogger(__name__)
+
+# live seat availability for the server-sent events stream. the write paths publish the ids of classes whose
+# counters changed, after their transaction commits. one hub per process collects those ids, waits a short
+# window so a burst of bookings on a class becomes a single event, reads the changed classes with one query
+# and hands every subscriber the rows it watches. writes made by other processes (other workers, management
+# commands) are picked up by polling the watched classes every AVAILABILITY_STREAM_POLL_INTERVAL seconds
+
+AVAILABILITY_FIELDS = ('id', 'available_slots', 'booked_count', 'waitlist_count')
+FETCH_BATCH_SIZE = 500
+
+def publish(*class_ids):
+    # called inside the write's transaction, subscribers only hear about committed changes
+    if class_ids:
+        transaction.on_commit(lambda: hub.mark_dirty(class_ids))
+
+async def fetch_availability(class_ids):
+    class_ids = sorted(class_ids)
+    rows = []
+    for start in range(0, len(class_ids), FETCH_BATCH_SIZE):
+        queryset = Classes.objects.filter(pk__in=class_ids[start:start + FETCH_BATCH_SIZE]).values(*AVAILABILITY_FIELDS)
+        rows += [row async for row in queryset]
+    return rows
+
+
+class Subscriber:
+    # one stream, changes that arrive faster than the client reads are merged so it only gets the latest row
+    def __init__(self, class_ids):
+        self.class_ids = frozenset(class_ids)
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, changed):
+        for class_id in self.class_ids & changed.keys():
+            self.pending[class_id] = changed[class_id]
+        if self.pending:
+            self.ready.set()
+
+    async def next(self, timeout):
+        # the next batch of changed rows, raises asyncio.TimeoutError when nothing changed for timeout seconds
+        await asyncio.wait_for(self.ready.wait(), timeout)
+        self.ready.clear()
+        rows, self.pending = self.pending, {}
+        return [rows[class_id] for class_id in sorted(rows)]
+
+
+class AvailabilityHub:
+    # fan-out of availability changes to the subscribers of this process, lives on the server's event loop
+
+    def __init__(self):
+        self.loop = None
+        self.reset()
+
+    def reset(self):
+        self.subscribers = set()
+        self.watching = Counter()
+        self.snapshot = {}
+        self.dirty = set()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def bind(self):
+        # a new event loop (e.g. a new test) starts from scratch
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.reset()
+
+    def mark_dirty(self, class_ids):
+        # may be called from any thread, the sync ORM runs outside the event loop
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._mark_dirty, set(class_ids))
+        except RuntimeError:
+            pass
+
+    def _mark_dirty(self, class_ids):
+        self.dirty |= class_ids
+        self.wakeup.set()
+
+    async def subscribe(self, class_ids):
+        self.bind()
+        subscriber = Subscriber(class_ids)
+        # the new subscriber starts from fresh rows, anything that changed meanwhile also goes to the others
+        await self.flush(subscriber.class_ids)
+        self.subscribers.add(subscriber)
+        self.watching.update(subscriber.class_ids)
+        subscriber.push({class_id: self.snapshot[class_id] for class_id in subscriber.class_ids if class_id in self.snapshot})
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.discard(subscriber)
+        self.watching.subtract(subscriber.class_ids)
+        for class_id in subscriber.class_ids:
+            if self.watching[class_id] <= 0:
+                del self.watching[class_id]
+                self.snapshot.pop(class_id, None)
+        if not self.subscribers:
+            # let the run loop see that nobody is left
+            self.wakeup.set()
+
+    async def run(self):
+        window = getattr(settings, 'AVAILABILITY_STREAM_WINDOW', 0.5)
+        poll_interval = getattr(settings, 'AVAILABILITY_STREAM_POLL_INTERVAL', 5)
+        try:
+            while self.subscribers:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), poll_interval)
+                    polled = False
+                except asyncio.TimeoutError:
+                    polled = True
+                # coalescing window, more changes to the same classes land in the same read
+                await asyncio.sleep(window)
+                self.wakeup.clear()
+                dirty, self.dirty = self.dirty, set()
+                await self.flush(self.watching.keys() if polled else dirty & self.watching.keys())
+        except Exception as e:
+            logger.exception(f"Availability hub stopped: {e}")
+        finally:
+            self.task = None
+
+    async def flush(self, class_ids):
+        if not class_ids:
+            return
+        changed = {}
+        for row in await fetch_availability(class_ids):
+            if self.snapshot.get(row['id']) != row:
+                self.snapshot[row['id']] = row
+                changed[row['id']] = row
+        if changed:
+            for subscriber in self.subscribers:
+                subscriber.push(changed)
+
+
+hub = AvailabilityHub()
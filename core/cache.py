@@ -0,0 +1,102 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from . import replicas
+
+# versioned response cache for the read heavy listings. every namespace ('classes', 'activities') has a
+# version counter that is part of each cache key, a write bumps the counter so all cached pages of that
+# namespace are invalidated at once instead of waiting for the timeout. a page read from a replica may be
+# older than the version it is cached under, it gets its own key, which pinned clients never read, and is
+# kept no longer than a pin lasts
+
+CLASSES = 'classes'
+ACTIVITIES = 'activities'
+
+def get_cache():
+    return caches[getattr(settings, 'LISTING_CACHE_ALIAS', 'default')]
+
+def version_key(namespace):
+    return f'zoomby:version:{namespace}'
+
+def fresh_version():
+    # a counter that got evicted restarts from the clock, so it never falls back onto an old version
+    return time.time_ns() // 1000
+
+def get_version(namespace):
+    cache = get_cache()
+    version = cache.get(version_key(namespace))
+    if version is None:
+        cache.add(version_key(namespace), fresh_version(), timeout=None)
+        version = cache.get(version_key(namespace))
+    return version
+
+async def aget_version(namespace):
+    cache = get_cache()
+    version = await cache.aget(version_key(namespace))
+    if version is None:
+        await cache.aadd(version_key(namespace), fresh_version(), timeout=None)
+        version = await cache.aget(version_key(namespace))
+    return version
+
+def _bump(namespace):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(namespace))
+    except ValueError:
+        cache.set(version_key(namespace), fresh_version(), timeout=None)
+
+def listing_timeout():
+    timeout = getattr(settings, 'LISTING_CACHE_TIMEOUT', 300)
+    if replicas.current.get() is not None:
+        return min(timeout, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+    return timeout
+
+def bump_version(*namespaces):
+    # bump right away for readers in this transaction and again on commit, so a page cached from
+    # pre-commit data by a concurrent reader doesn't outlive the write
+    for namespace in namespaces:
+        _bump(namespace)
+        transaction.on_commit(lambda namespace=namespace: _bump(namespace))
+
+def response_key(namespace, request, version=None):
+    # every query param is part of the key (tz, fields, cursor, page_size ...), in a stable order
+    if version is None:
+        version = get_version(namespace)
+    params = sorted((name, sorted(values)) for name, values in request.query_params.lists())
+    raw = f'{request.get_host()}|{request.path}|{params}'
+    if replicas.current.get() is not None:
+        raw += '|replica'
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'zoomby:response:{namespace}:{version}:{digest}'
+
+
+class CachedReadMixin:
+    # caches list and retrieve responses of a viewset under `cache_namespace`
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = response_key(self.cache_namespace, request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(self.refresh_cached_data(data))
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=listing_timeout())
+        return response
+
+    def refresh_cached_data(self, data):
+        # hook for values that must not be served from cache
+        return data
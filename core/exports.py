@@ -0,0 +1,47 @@
+import csv
+import json
+from datetime import datetime
+
+# streaming bookings export, rows come straight from .values().iterator() and are written out one at a
+# time so memory stays flat no matter how many bookings there are
+
+EXPORT_CHUNK_SIZE = 2000
+
+# same fields, names and order as BookingsSerializer
+EXPORT_FIELDS = (
+    'id', 'client_name', 'client_email', 'created_at', 'updated_at',
+    'is_active', 'is_waitlisted', 'classes', 'created_by', 'updated_by',
+)
+EXPORT_COLUMNS = (
+    'id', 'client_name', 'client_email', 'created_at', 'updated_at',
+    'is_active', 'is_waitlisted', 'classes_id', 'created_by_id', 'updated_by_id',
+)
+
+# datetimes the way DRF writes them, full precision and Z for UTC
+def format_datetime(value):
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for row in queryset.order_by('id').values_list(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size):
+        yield {
+            name: format_datetime(value) if isinstance(value, datetime) else value
+            for name, value in zip(EXPORT_FIELDS, row)
+        }
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+# csv.writer writes into this and hands the line straight back
+class Echo:
+    def write(self, value):
+        return value
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[name] for name in EXPORT_FIELDS])
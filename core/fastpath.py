@@ -0,0 +1,234 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import fields, relations
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .models import Activities, Bookings, Classes
+from .serializers import ActivitiesSerializer, BookingsSerializer, ClassesSerializer
+
+# read only fast path for the list endpoints. a page is read with .values() and every row is turned into
+# the output dict by a plan built once per request from the serializer's own (already ?fields= trimmed)
+# fields: plain columns are copied, datetimes formatted the way DRF's DateTimeField does, many to many ids
+# come from one query on the through table and the method fields are reimplemented on rows. a serializer
+# with a field the plan doesn't know is served by the regular serializer, so the output never changes
+
+# fields whose output is the column value as the database returns it
+COPIED_FIELDS = (fields.IntegerField, fields.CharField, fields.EmailField, fields.BooleanField)
+
+# plan column of method fields that have one value for the whole page
+CONSTANT = object()
+
+DAY = timedelta(days=1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class Localizer:
+    # value.astimezone(tz).isoformat() for a batch of datetimes. the offset (and its text) is looked up once
+    # per UTC day, a day with a transition in it also keeps the instant of the change, found by bisection,
+    # and the local time is plain arithmetic on the UTC value. anything not in datetime.timezone.utc (which
+    # is what the database returns) is converted value by value
+    def __init__(self, tz):
+        self.tz = tz
+        self.days = {}
+
+    def describe(self, moment):
+        local = moment.astimezone(self.tz)
+        text = local.isoformat()
+        return local.utcoffset(), text[len(local.replace(tzinfo=None).isoformat()):]
+
+    def day(self, ordinal):
+        start = datetime.fromordinal(ordinal).replace(tzinfo=dt_timezone.utc)
+        before, after = self.describe(start), self.describe(start + DAY - MICROSECOND)
+        if before == after:
+            return None, before, after
+        low, high = start, start + DAY - MICROSECOND
+        while high - low > MICROSECOND:
+            middle = low + (high - low) // 2
+            if self.describe(middle) == before:
+                low = middle
+            else:
+                high = middle
+        return high, before, after
+
+    def __call__(self, value):
+        if value.tzinfo is not dt_timezone.utc:
+            return value.astimezone(self.tz).isoformat()
+        ordinal = value.toordinal()
+        if ordinal not in self.days:
+            self.days[ordinal] = self.day(ordinal)
+        change, before, after = self.days[ordinal]
+        offset, suffix = before if change is None or value < change else after
+        return (value + offset).isoformat()[:-6] + suffix
+
+
+class ValuesSerializer:
+    serializer_class = None
+    model = None
+
+    def __init__(self, context):
+        self.context = context
+        self.serializer = self.serializer_class(context=context)
+        self.plan = self.build_plan()
+
+    def build_plan(self):
+        # [(output name, column, convert)] or None when a field can't be reproduced from a row
+        plan = []
+        for field in self.serializer.fields.values():
+            if field.write_only:
+                continue
+            kind = type(field)
+            if kind in COPIED_FIELDS or (kind is relations.PrimaryKeyRelatedField and field.pk_field is None):
+                plan.append((field.field_name, field.source, None))
+            elif kind is fields.DateTimeField and getattr(field, 'format', api_settings.DATETIME_FORMAT) == fields.ISO_8601:
+                tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+                if tz is None:
+                    return None
+                plan.append((field.field_name, field.source, self.datetime_formatter(tz)))
+            elif (kind is relations.ManyRelatedField and type(field.child_relation) is relations.PrimaryKeyRelatedField
+                  and field.child_relation.pk_field is None):
+                plan.append((field.field_name, 'id', self.many_to_many(field.source)))
+            elif kind is fields.SerializerMethodField and hasattr(self, field.method_name):
+                method = getattr(self, field.method_name)
+                plan.append((field.field_name, CONSTANT if getattr(method, 'constant', False) else None, method))
+            else:
+                return None
+        return plan
+
+    @property
+    def supported(self):
+        return self.plan is not None
+
+    def columns(self, extra=()):
+        names = {'id', *extra}
+        for _, column, convert in self.plan:
+            if column is not None and column is not CONSTANT:
+                names.add(column)
+            names.update(getattr(convert, 'columns', ()))
+        return sorted(names)
+
+    def datetime_formatter(self, tz):
+        # DRF's DateTimeField output
+        localize = Localizer(tz)
+        def convert(value):
+            text = localize(value)
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return convert
+
+    def many_to_many(self, name):
+        # the related ids of the whole page are read in serialize() with one query
+        descriptor = getattr(self.model, name)
+        through = descriptor.through
+        source, target = descriptor.field.m2m_field_name(), descriptor.field.m2m_reverse_name()
+        ids = {}
+        def load(rows):
+            ids.clear()
+            related = (
+                through.objects.filter(**{f'{source}__in': [row['id'] for row in rows]})
+                .order_by(source, target).values_list(source, target)
+            )
+            for owner, target_id in related:
+                ids.setdefault(owner, []).append(target_id)
+        def convert(pk):
+            return ids.get(pk, [])
+        convert.load = load
+        return convert
+
+    def serialize(self, rows):
+        rows = list(rows)
+        constants = {}
+        for name, column, convert in self.plan:
+            if hasattr(convert, 'load'):
+                convert.load(rows)
+            if column is CONSTANT:
+                constants[name] = convert(None)
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in self.plan:
+                if column is None:
+                    item[name] = convert(row)
+                    continue
+                if column is CONSTANT:
+                    item[name] = constants[name]
+                    continue
+                value = row[column]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+
+class ClassesValuesSerializer(ValuesSerializer):
+    serializer_class = ClassesSerializer
+    model = Classes
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.localizer = Localizer(self.serializer.get_timezone())
+
+    def localize(self, dt):
+        # ClassesSerializer.convert_to_user_timezone
+        if not dt:
+            return None
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt)
+        return self.localizer(dt)
+
+    def get_delivery_date_local(self, row):
+        return self.localize(row['delivery_date'])
+    get_delivery_date_local.columns = ('delivery_date',)
+
+    def get_cutoff_date_local(self, row):
+        return self.localize(row['cutoff_date'])
+    get_cutoff_date_local.columns = ('cutoff_date',)
+
+    # the same for every row, computed once per page
+    def get_server_timezone(self, row):
+        return self.serializer.get_server_timezone(None)
+    get_server_timezone.constant = True
+
+    def get_server_time(self, row):
+        return self.serializer.get_server_time(None)
+    get_server_time.constant = True
+
+
+class BookingsValuesSerializer(ValuesSerializer):
+    serializer_class = BookingsSerializer
+    model = Bookings
+
+
+class ActivitiesValuesSerializer(ValuesSerializer):
+    serializer_class = ActivitiesSerializer
+    model = Activities
+
+
+class FastListMixin:
+    # list() through values_serializer_class when READ_FAST_PATH is on, pages hold dicts instead of
+    # instances, which the cursor pagination reads its position from just the same
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        return self.paginated_list(self.filter_queryset(self.get_queryset()))
+
+    def get_values_serializer(self):
+        if not getattr(settings, 'READ_FAST_PATH', True) or self.values_serializer_class is None:
+            return None
+        values_serializer = self.values_serializer_class(context=self.get_serializer_context())
+        return values_serializer if values_serializer.supported else None
+
+    def paginated_list(self, queryset):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            page = self.paginate_queryset(queryset)
+            if page is None:
+                return Response(self.get_serializer(queryset, many=True).data)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', ())]
+        rows = queryset.prefetch_related(None).values(*values_serializer.columns(ordering))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(values_serializer.serialize(rows))
+        return self.get_paginated_response(values_serializer.serialize(page))
@@ -0,0 +1,162 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+# logger
+logger = logging.getLogger(__name__)
+
+# Idempotency-Key support for POST /book/ (and /book/bulk/). the first response for a key is stored with a
+# ttl and a retry with the same key gets it back without touching the database. a retry that arrives while
+# the first request is still running gets 409, a key reused with a different body gets 422. the in-progress
+# marker only holds a short lease (IDEMPOTENCY_LOCK_TTL), so a worker that dies mid request doesn't block
+# the key for the whole ttl, a retry after the lease runs it again
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+IN_PROGRESS = 'in-progress'
+
+
+class LocalIdempotencyStore:
+    # in process LRU with a ttl, for a single node
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def get(self, key):
+        with self.lock:
+            return self._live(key)
+
+    def add(self, key, value, ttl):
+        with self.lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def _store(self, key, value, ttl):
+        self.entries[key] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+
+
+class CacheIdempotencyStore:
+    # a django cache backend shared by every node (redis, memcached ...)
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def add(self, key, value, ttl):
+        return self.cache.add(key, value, timeout=ttl)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, timeout=ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if getattr(settings, 'IDEMPOTENCY_STORE', 'local') == 'cache':
+                _store = CacheIdempotencyStore(getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default'))
+            else:
+                _store = LocalIdempotencyStore(getattr(settings, 'IDEMPOTENCY_MAX_KEYS', 10000))
+        return _store
+
+def fingerprint(data):
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def idempotent(scope):
+    # decorator for viewset actions, responses below 500 are stored under the key
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            store = get_store()
+            ttl = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60)
+            lock_ttl = getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 30)
+            store_key = f'zoomby:idempotency:{scope}:{key}'
+            request_fingerprint = fingerprint(request.data)
+
+            if not store.add(store_key, IN_PROGRESS, lock_ttl):
+                stored = store.get(store_key)
+                if stored is None or stored == IN_PROGRESS:
+                    return Response(
+                        {'error': f'A request with this {HEADER} is still in progress.'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                if stored['fingerprint'] != request_fingerprint:
+                    return Response(
+                        {'error': f'{HEADER} was already used with a different request.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                logger.info(f"Replayed {scope} response for {HEADER} {key}")
+                return Response(stored['data'], status=stored['status'], headers={'Idempotent-Replayed': 'true'})
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                store.delete(store_key)
+                raise
+
+            if response.status_code < 500:
+                store.set(store_key, {
+                    'fingerprint': request_fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                }, ttl)
+            else:
+                store.delete(store_key)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,94 @@
+import copy
+import logging
+import logging.handlers
+import queue
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# logging off the request thread. QueuedHandler is configured in LOGGING like the handler it wraps
+# ('handler_class' plus that handler's own arguments), the request thread only puts the record on a bounded
+# queue and a listener thread formats and writes it, so a slow disk or a file rotation no longer shows up in
+# request latency. the listener starts in the process that configures logging (every worker) and drains the
+# queue when logging shuts down at exit. it is a plain Handler on purpose: from Python 3.12 on dictConfig
+# configures every QueueHandler subclass its own way and wants 'handlers' / 'queue' / 'listener' keys
+
+QUEUE_SIZE = 10000
+
+
+class Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # wait for room, stopping must not lose the records still queued
+        self.queue.put(self._sentinel)
+
+
+class QueuedHandler(logging.Handler):
+    def __init__(self, handler_class, queue_size=QUEUE_SIZE, **kwargs):
+        super().__init__()
+        self.queue = queue.Queue(queue_size)
+        self.target = import_string(handler_class)(**kwargs)
+        self.dropped = 0
+        self.listener = Listener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def emit(self, record):
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record):
+        # the message is merged with its args on the request thread, the args may have changed (or hold a
+        # connection) by the time the listener formats it. same as QueueHandler.prepare
+        message = self.format(record)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def setFormatter(self, fmt):
+        # the formatter runs in the listener, the record is only merged with its args here
+        self.target.setFormatter(fmt)
+
+    def enqueue(self, record):
+        # a full queue drops the record instead of blocking the request, the count is logged once there is room
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self.dropped_record())
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def dropped_record(self):
+        return logging.makeLogRecord({
+            'name': __name__,
+            'levelno': logging.WARNING,
+            'levelname': 'WARNING',
+            'msg': f"Log queue full, dropped {self.dropped} records",
+        })
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
+
+
+class Payload:
+    # request / response data for a log message, turned into text only when the record is emitted and cut at
+    # LOG_PAYLOAD_MAX_LENGTH characters
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        text = str(self.data)
+        limit = getattr(settings, 'LOG_PAYLOAD_MAX_LENGTH', 1000)
+        if limit is not None and len(text) > limit:
+            return f'{text[:limit]}... ({len(text)} chars)'
+        return text
@@ -1,10 +1,17 @@
 import logging
 import csv
 import os
+import time
+from collections import Counter, defaultdict
+from itertools import islice
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
 from core.models import *
+from core.actors import service_account
+from core.cache import ACTIVITIES, CLASSES, bump_version
+from core.reservations import update_counters
+from django.db import transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import datetime
@@ -14,6 +21,20 @@ from datetime import datetime
 # logger
 logger = logging.getLogger(__name__)
 
+ACTIVITIES_CSV = 'file/organizer/activities.csv'
+CLASSES_CSV = 'file/organizer/classes.csv'
+BOOKINGS_CSV = 'file/organizer/bookings.csv'
+DEFAULT_CHUNK_SIZE = 10000
+BULK_BATCH_SIZE = 2000
+
+# csv flags come in as text, bool('0') would be True. only the bulk mode parses them, the row by row import
+# keeps its bool() so existing seed files import as before
+def parse_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def parse_datetime(value):
+    return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d %H:%M:%S'))
+
 def create_super_user():
     User = get_user_model()
     if not User.objects.filter(is_superuser=True).exists():
@@ -25,17 +46,16 @@ def create_super_user():
         return True
     else:
         return False
-def create_activities():
+def create_activities(csv_file_path=ACTIVITIES_CSV):
     # this function will create activities required for classes to be created fetching activities data from csv file
 
-    csv_file_path = 'file/organizer/activities.csv'
-
     if not os.path.exists(csv_file_path):
         error_msg = f"CSV file does not exist: {csv_file_path}"
         logger.error(error_msg)
         return
 
     try:
+        user = service_account.get()
         with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             created_count = 0
@@ -45,8 +65,8 @@ def create_activities():
                     activity = Activities.objects.create(
                         name=row['name'],
                         description=row['description'],
-                        created_by=User.objects.filter(is_superuser=True).first(),
-                        updated_by=User.objects.filter(is_superuser=True).first()
+                        created_by=user,
+                        updated_by=user
                     )
                     created_count += 1
                     logger.info(f"Created Activity: {activity.name}")
@@ -59,17 +79,16 @@ def create_activities():
         logger.exception(f"Unexpected error during CSV import of in {csv_file_path}: {e}")
 
 
-def create_classes():
+def create_classes(csv_file_path=CLASSES_CSV):
     # this function will create activities required for classes to be created fetching activities data from csv file
 
-    csv_file_path = 'file/organizer/classes.csv'
-
     if not os.path.exists(csv_file_path):
         error_msg = f"CSV file does not exist: {csv_file_path}"
         logger.error(error_msg)
         return
 
     try:
+        user = service_account.get()
         with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             created_count = 0
@@ -88,8 +107,8 @@ def create_classes():
                         allow_waitlist=bool(row['allow_waitlist']),
                         instructor=User.objects.get(id=row['instructor']),
                         available_slots=row['available_slots'],
-                        created_by=User.objects.filter(is_superuser=True).first(),
-                        updated_by=User.objects.filter(is_superuser=True).first()
+                        created_by=user,
+                        updated_by=user
                     )
                     activity_ids = [int(pk.strip()) for pk in row['activities'].split(',')]
                     activities = Activities.objects.filter(id__in=activity_ids)
@@ -104,17 +123,16 @@ def create_classes():
     except Exception as e:
         logger.exception(f"Unexpected error during CSV import of in {csv_file_path}: {e}")
 
-def create_bookings():
+def create_bookings(csv_file_path=BOOKINGS_CSV):
     # this function will create activities required for classes to be created fetching activities data from csv file
 
-    csv_file_path = 'file/organizer/bookings.csv'
-
     if not os.path.exists(csv_file_path):
         error_msg = f"CSV file does not exist: {csv_file_path}"
         logger.error(error_msg)
         return
 
     try:
+        user = service_account.get()
         with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
             created_count = 0
@@ -125,8 +143,8 @@ def create_bookings():
                         client_name=row['name'],
                         client_email=row['email'],
                         classes=Classes.objects.get(id=row['class']),
-                        created_by=User.objects.filter(is_superuser=True).first(),
-                        updated_by=User.objects.filter(is_superuser=True).first()
+                        created_by=user,
+                        updated_by=user
                     )
                     created_count += 1
                     logger.info(f"Created Booking for: {booking.client_name}")
@@ -138,27 +156,219 @@ def create_bookings():
     except Exception as e:
         logger.exception(f"Unexpected error during CSV import of in {csv_file_path}: {e}")
 
+# bulk mode, the csv files are streamed in chunks and every chunk goes in with bulk_create inside its own
+# transaction. foreign keys are resolved through one lookup query per chunk instead of one per row
+
+def read_chunks(csv_file_path, chunk_size):
+    with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
+        rows = enumerate(csv.DictReader(csvfile), start=2)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+def bulk_create_activities(user, csv_file_path=ACTIVITIES_CSV, chunk_size=DEFAULT_CHUNK_SIZE):
+    created_count = 0
+    for chunk in read_chunks(csv_file_path, chunk_size):
+        names = {row['name'] for _, row in chunk}
+        existing = set(Activities.objects.filter(name__in=names).values_list('name', flat=True))
+        new_activities = []
+        for row_number, row in chunk:
+            if row['name'] in existing:
+                logger.error(f"Row {row_number} in {csv_file_path}: Activity {row['name']} already exists")
+                continue
+            existing.add(row['name'])
+            new_activities.append(Activities(
+                name=row['name'],
+                description=row['description'],
+                created_by=user,
+                updated_by=user
+            ))
+        with transaction.atomic():
+            Activities.objects.bulk_create(new_activities)
+        created_count += len(new_activities)
+
+    # bulk_create sends no signals
+    bump_version(ACTIVITIES, CLASSES)
+    logger.info(f"Bulk import finished. Total activities created: {created_count}")
+    return created_count
+
+def bulk_create_classes(user, csv_file_path=CLASSES_CSV, chunk_size=DEFAULT_CHUNK_SIZE):
+    created_count = 0
+    through = Classes.activities.through
+    for chunk in read_chunks(csv_file_path, chunk_size):
+        parsed = []
+        for row_number, row in chunk:
+            try:
+                activity_ids = [int(pk.strip()) for pk in row['activities'].split(',') if pk.strip()]
+                parsed.append((row_number, row, int(row['instructor']), activity_ids))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Row {row_number} in {csv_file_path}: Failed to create class Error: {e}")
+
+        instructors = set(User.objects.filter(id__in={item[2] for item in parsed}).values_list('id', flat=True))
+        activities = set(Activities.objects.filter(
+            id__in={pk for item in parsed for pk in item[3]}
+        ).values_list('id', flat=True))
+
+        new_classes = []
+        for row_number, row, instructor_id, activity_ids in parsed:
+            if instructor_id not in instructors:
+                logger.error(f"Row {row_number} in {csv_file_path}: Instructor {instructor_id} does not exist")
+                continue
+            try:
+                classes = Classes(
+                    name=row['name'],
+                    description=row['description'],
+                    delivery_date=parse_datetime(row['delivery_date']),
+                    cutoff_date=parse_datetime(row['cutoff_date']),
+                    allow_waitlist=parse_bool(row['allow_waitlist']),
+                    instructor_id=instructor_id,
+                    available_slots=int(row['available_slots']),
+                    created_by=user,
+                    updated_by=user
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Row {row_number} in {csv_file_path}: Failed to create class Error: {e}")
+                continue
+            new_classes.append((classes, [pk for pk in activity_ids if pk in activities]))
+
+        with transaction.atomic():
+            Classes.objects.bulk_create([classes for classes, _ in new_classes])
+            through.objects.bulk_create([
+                through(classes_id=classes.pk, activities_id=activity_id)
+                for classes, activity_ids in new_classes
+                for activity_id in activity_ids
+            ])
+        created_count += len(new_classes)
+
+    bump_version(CLASSES)
+    logger.info(f"Bulk import finished. Total classes created: {created_count}")
+    return created_count
+
+def bulk_create_bookings(user, csv_file_path=BOOKINGS_CSV, chunk_size=DEFAULT_CHUNK_SIZE):
+    # slot and waitlist state of every class is loaded once and kept in memory, each chunk decides
+    # booked / waitlisted / rejected in memory, inserts with one bulk_create and writes the taken seats
+    # and counters back to the database with a CASE update for all classes of the chunk
+    created_count = 0
+    slots = {}
+    for chunk in read_chunks(csv_file_path, chunk_size):
+        items = []
+        for row_number, row in chunk:
+            try:
+                items.append((row_number, row['name'], row['email'], int(row['class'])))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Row {row_number} in {csv_file_path}: Failed to create booking Error: {e}")
+
+        class_ids = {item[3] for item in items}
+        unseen = class_ids - slots.keys()
+        for class_id, available, allow_waitlist in Classes.objects.filter(id__in=unseen).values_list(
+            'id', 'available_slots', 'allow_waitlist'
+        ):
+            slots[class_id] = [available, allow_waitlist]
+        taken = set(
+            Bookings.objects.filter(classes_id__in=class_ids, client_email__in={item[2] for item in items})
+            .values_list('client_email', 'classes_id')
+        )
+
+        new_bookings = []
+        deltas = defaultdict(Counter)
+        for row_number, name, email, class_id in items:
+            state = slots.get(class_id)
+            if state is None:
+                logger.error(f"Row {row_number} in {csv_file_path}: Class {class_id} does not exist")
+                continue
+            if (email, class_id) in taken:
+                logger.error(f"Row {row_number} in {csv_file_path}: {email} already booked class {class_id}")
+                continue
+            if state[0] > 0:
+                state[0] -= 1
+                deltas[class_id].update(available_slots=-1, booked_count=1)
+                is_waitlisted = False
+            elif state[1]:
+                deltas[class_id]['waitlist_count'] += 1
+                is_waitlisted = True
+            else:
+                logger.error(f"Row {row_number} in {csv_file_path}: No available slots and class does not allow waitlist")
+                continue
+            taken.add((email, class_id))
+            new_bookings.append(Bookings(
+                client_name=name,
+                client_email=email,
+                classes_id=class_id,
+                is_waitlisted=is_waitlisted,
+                created_by=user,
+                updated_by=user
+            ))
+
+        # bulk_create skips Bookings.save, so the seats and counters are taken here
+        with transaction.atomic():
+            Bookings.objects.bulk_create(new_bookings, batch_size=BULK_BATCH_SIZE)
+            update_counters(deltas)
+        created_count += len(new_bookings)
+
+    bump_version(CLASSES)
+    logger.info(f"Bulk import finished. Total bookings created: {created_count}")
+    return created_count
+
 class Command(BaseCommand):
     help = 'creates a superuser activities, classes, and sample bookins'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true', help='stream the csv files in chunks and insert with bulk_create')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per chunk in bulk mode')
+        parser.add_argument('--activities-csv', default=ACTIVITIES_CSV)
+        parser.add_argument('--classes-csv', default=CLASSES_CSV)
+        parser.add_argument('--bookings-csv', default=BOOKINGS_CSV)
+
+    def bulk_import(self, options):
+        user = service_account.get()
+        steps = (
+            ('activities', bulk_create_activities, options['activities_csv']),
+            ('classes', bulk_create_classes, options['classes_csv']),
+            ('bookings', bulk_create_bookings, options['bookings_csv']),
+        )
+        for label, step, csv_file_path in steps:
+            if not os.path.exists(csv_file_path):
+                logger.error(f"CSV file does not exist: {csv_file_path}")
+                self.stdout.write(self.style.ERROR(f'CSV file does not exist: {csv_file_path}'))
+                continue
+            started = time.perf_counter()
+            created_count = step(user, csv_file_path, options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            rate = created_count / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'Imported {created_count} {label} in {elapsed:.2f}s ({rate:,.0f} rows/s)'
+            ))
+
     def handle(self, *args, **options):
         user_created = create_super_user()
+
+        if options['bulk']:
+            if user_created:
+                self.stdout.write(self.style.SUCCESS('Superuser created successfully : Login "admin" and "admin" '))
+            try:
+                self.bulk_import(options)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Error creating activities, classes, and bookings: {e}'))
+            self.stdout.write(self.style.SUCCESS('Successfully executed Organizer'))
+            return
         
         if user_created:
             self.stdout.write(self.style.SUCCESS('Superuser created successfully : Login "admin" and "admin" '))
             try:
-                create_activities()
-                create_classes()
-                create_bookings()
+                create_activities(options['activities_csv'])
+                create_classes(options['classes_csv'])
+                create_bookings(options['bookings_csv'])
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error creating activities, classes, and bookings: {e}'))
 
         else:
             self.stdout.write(self.style.SUCCESS('Superuser already exists!'))
             try:
-                create_activities()
-                create_classes()
-                create_bookings()
+                create_activities(options['activities_csv'])
+                create_classes(options['classes_csv'])
+                create_bookings(options['bookings_csv'])
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error creating activities, classes, and bookings: {e}'))
                 
@@ -0,0 +1,33 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from core.models import Bookings
+from core.reservations import promote_waitlists
+
+# logger
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'promotes waitlisted bookings onto free seats, for the given classes or every class with a waitlist'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class', dest='class_ids', type=int, nargs='*', help='class ids, default all classes with a waitlist')
+
+    def handle(self, *args, **options):
+        class_ids = options['class_ids']
+        if not class_ids:
+            class_ids = list(
+                Bookings.objects.filter(is_active=True, is_waitlisted=True)
+                .order_by()
+                .values_list('classes_id', flat=True)
+                .distinct()
+            )
+
+        started = time.perf_counter()
+        promoted = promote_waitlists(class_ids)
+        elapsed = time.perf_counter() - started
+
+        logger.info(f"Waitlist promotion: {sum(promoted.values())} bookings in {len(promoted)} classes")
+        self.stdout.write(self.style.SUCCESS(
+            f'Promoted {sum(promoted.values())} bookings in {len(promoted)} of {len(class_ids)} classes in {elapsed:.2f}s'
+        ))
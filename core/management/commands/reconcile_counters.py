@@ -0,0 +1,30 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from core.reservations import RECONCILE_BATCH_SIZE, reconcile_counters
+
+# logger
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'recomputes the booked and waitlist counters of classes from their bookings and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class', dest='class_ids', type=int, nargs='*', help='class ids, default all classes')
+        parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE, help='classes per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='only report drift, leave the counters as they are')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        drift = reconcile_counters(options['class_ids'], options['batch_size'], fix=not options['dry_run'])
+        elapsed = time.perf_counter() - started
+
+        for class_id, (booked, waitlist), (actual_booked, actual_waitlist) in drift:
+            message = (
+                f'Class {class_id}: booked {booked} -> {actual_booked}, waitlist {waitlist} -> {actual_waitlist}'
+            )
+            logger.warning(message)
+            self.stdout.write(message)
+
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'Counter drift {action} in {len(drift)} classes in {elapsed:.2f}s'))
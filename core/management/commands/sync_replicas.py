@@ -0,0 +1,47 @@
+import logging
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# logger
+logger = logging.getLogger(__name__)
+
+# stand-in replication for trying DATABASE_REPLICAS locally with SQLite files: the primary is copied into
+# every replica with SQLite's online backup, readers of the replica keep working while it runs. postgres
+# replicas are kept up by the server's own replication
+
+class Command(BaseCommand):
+    help = 'copies the primary SQLite database into the SQLite replicas of DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='keep copying every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('No replicas configured, set ZOOMBY_DB_REPLICAS')
+        for alias in [DEFAULT_DB_ALIAS, *replicas]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias} is not a SQLite database, only SQLite replicas can be synced')
+
+        while True:
+            for alias in replicas:
+                self.sync(alias)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, alias):
+        started = time.perf_counter()
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        elapsed = time.perf_counter() - started
+        logger.info(f'Synced replica {alias} in {elapsed:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Synced {alias} in {elapsed:.2f}s'))
@@ -0,0 +1,225 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+# logger
+logger = logging.getLogger(__name__)
+
+# per view request metrics in Prometheus text format on /metrics. the middleware times every request and a
+# database execute wrapper, installed on each connection as it opens, adds the queries to the request that is
+# running in the current context (contextvars follow async views into the threads that run their queries).
+# the numbers live in the process, every worker exposes its own and Prometheus sums them per instance
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+current = contextvars.ContextVar('zoomby_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'statements')
+
+    def __init__(self, keep_statements):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = [] if keep_statements else None
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.statements is not None:
+            stats.statements.append((elapsed, sql))
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    # the wrapper list belongs to the connection object and survives reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield format_value(bound), total
+        yield '+Inf', total + self.counts[-1]
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_labels(labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return ','.join(f'{name}="{value}"' for name, value in escaped)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.durations = {}
+        self.queries = {}
+        self.db_time = {}
+        self.sizes = {}
+
+    def observe(self, method, view, status, duration, queries, db_time, size):
+        with self.lock:
+            key = (method, view, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            key = (method, view)
+            if key not in self.durations:
+                self.durations[key] = Histogram(DURATION_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.db_time[key] = 0.0
+            self.durations[key].observe(duration)
+            self.queries[key].observe(queries)
+            self.db_time[key] += db_time
+            if size is not None:
+                if key not in self.sizes:
+                    self.sizes[key] = Histogram(SIZE_BUCKETS)
+                self.sizes[key].observe(size)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            self.render_counter(lines, 'zoomby_requests_total', 'Requests by view and status.',
+                                ('method', 'view', 'status'), self.requests)
+            self.render_histogram(lines, 'zoomby_request_duration_seconds', 'Time until the response was returned.',
+                                  self.durations)
+            self.render_histogram(lines, 'zoomby_request_db_queries', 'Database queries per request.', self.queries)
+            self.render_counter(lines, 'zoomby_request_db_seconds_total', 'Time spent in database queries.',
+                                ('method', 'view'), self.db_time)
+            self.render_histogram(lines, 'zoomby_response_size_bytes', 'Response body size, streamed responses are not counted.',
+                                  self.sizes)
+        return '\n'.join(lines) + '\n'
+
+    def render_counter(self, lines, name, help_text, label_names, values):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for key in sorted(values):
+            lines.append(f'{name}{{{format_labels(zip(label_names, key))}}} {format_value(values[key])}')
+
+    def render_histogram(self, lines, name, help_text, histograms):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (method, view) in sorted(histograms):
+            histogram = histograms[method, view]
+            labels = format_labels((('method', method), ('view', view)))
+            for bound, total in histogram.samples():
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'{name}_sum{{{labels}}} {format_value(histogram.sum)}')
+            lines.append(f'{name}_count{{{labels}}} {total}')
+
+
+registry = Registry()
+
+
+def view_name(request):
+    # the url name keeps the label set small, unmatched urls (404s) share one label
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    # first in MIDDLEWARE so the time covers the whole stack, works for sync and async views alike
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, stats, started)
+        return response
+
+    def start(self):
+        # the statements are only kept when slow requests are logged
+        stats = RequestStats(keep_statements=self.slow_threshold is not None)
+        return stats, current.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+        view = view_name(request)
+        registry.observe(
+            request.method, view, response.status_code, duration, stats.queries, stats.db_time, response_size(response)
+        )
+        if self.slow_threshold is not None and duration >= self.slow_threshold:
+            self.log_slow_request(request, response, view, duration, stats)
+
+    def log_slow_request(self, request, response, view, duration, stats):
+        limit = getattr(settings, 'SLOW_REQUEST_MAX_STATEMENTS', 20)
+        slowest = sorted(stats.statements, key=lambda statement: statement[0], reverse=True)[:limit]
+        statements = ''.join(f'\n  {elapsed * 1000:.1f}ms {sql}' for elapsed, sql in slowest)
+        logger.warning(
+            f"Slow request {request.method} {request.path} ({view}) {response.status_code} took {duration * 1000:.0f}ms, "
+            f"{stats.queries} queries in {stats.db_time * 1000:.0f}ms{statements}"
+        )
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse('Unauthorized\n', status=401, content_type=CONTENT_TYPE)
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
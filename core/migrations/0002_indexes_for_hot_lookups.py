@@ -0,0 +1,43 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activities',
+            index=models.Index(fields=['created_at', 'id'], name='activity_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(fields=['client_email', 'created_at', 'id'], name='booking_email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(fields=['created_at', 'id'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_waitlisted', False)), fields=['classes', 'created_at'], name='booking_class_booked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classes',
+            index=models.Index(fields=['delivery_date', 'id'], name='class_delivery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classes',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['delivery_date', 'id'], name='class_active_delivery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classes',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['cutoff_date'], name='class_active_cutoff_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 09:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_indexes_for_hot_lookups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookings',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_waitlisted', True)), fields=['classes', 'created_at', 'id'], name='booking_class_waitlist_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-18 09:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Bookings = apps.get_model('core', 'Bookings')
+    Classes = apps.get_model('core', 'Classes')
+    rows = (
+        Bookings.objects.filter(is_active=True).order_by()
+        .values('classes_id', 'is_waitlisted').annotate(count=Count('id'))
+        .values_list('classes_id', 'is_waitlisted', 'count')
+    )
+    for class_id, is_waitlisted, count in rows:
+        field = 'waitlist_count' if is_waitlisted else 'booked_count'
+        Classes.objects.filter(pk=class_id).update(**{field: count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_waitlist_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classes',
+            name='booked_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='classes',
+            name='waitlist_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_class_booking_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='classes',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['delivery_date', 'id'], name='class_inactive_delivery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classes',
+            index=models.Index(fields=['instructor', 'delivery_date', 'id'], name='class_instructor_delivery_idx'),
+        ),
+        # ?activities= reads classes_id WHERE activities_id IN (...), this composite answers it from the index
+        # alone where the single column activities_id index of the foreign key still reads every table row.
+        # the through table belongs to the ManyToManyField, an explicit through model would make activities
+        # read only in ClassesSerializer and the admin, so the index is created here. guarded both ways for
+        # databases where it was created or dropped by hand (sqlite and postgres both accept IF [NOT] EXISTS)
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS class_activity_classes_idx ON core_classes_activities (activities_id, classes_id)',
+            reverse_sql='DROP INDEX IF EXISTS class_activity_classes_idx',
+        ),
+    ]
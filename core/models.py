@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 class Activities(models.Model):
@@ -12,6 +12,10 @@ class Activities(models.Model):
     class Meta:
         verbose_name = "Activity"
         verbose_name_plural = "Activities"
+        indexes = [
+            # cursor pagination order
+            models.Index(fields=['created_at', 'id'], name='activity_created_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -25,6 +29,9 @@ class Classes(models.Model):
     instructor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='instructor')
     activities = models.ManyToManyField(Activities)
     available_slots = models.IntegerField()
+    # denormalized counts of active bookings, kept up to date by the reservation engine
+    booked_count = models.IntegerField(default=0)
+    waitlist_count = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -34,6 +41,61 @@ class Classes(models.Model):
     class Meta:
         verbose_name = "Class"
         verbose_name_plural = "Classes"
+        indexes = [
+            # cursor pagination order
+            models.Index(fields=['delivery_date', 'id'], name='class_delivery_idx'),
+            # class browsing, active upcoming classes and classes still open for booking
+            models.Index(fields=['delivery_date', 'id'], condition=models.Q(is_active=True), name='class_active_delivery_idx'),
+            models.Index(fields=['cutoff_date'], condition=models.Q(is_active=True), name='class_active_cutoff_idx'),
+            # class search, ?is_active=false and ?instructor= in pagination order
+            models.Index(fields=['delivery_date', 'id'], condition=models.Q(is_active=False), name='class_inactive_delivery_idx'),
+            models.Index(fields=['instructor', 'delivery_date', 'id'], name='class_instructor_delivery_idx'),
+        ]
+
+    # the seat counters are moved by the reservation engine with F() updates while an edit (api, admin,
+    # organizer) may hold a stale copy of the row, so a save of an existing class never writes them back.
+    # a changed available_slots is applied as the difference to the value the instance was loaded with
+    COUNTER_FIELDS = ('available_slots', 'booked_count', 'waitlist_count')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_slots = instance.__dict__.get('available_slots')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or 'available_slots' in fields:
+            self._loaded_slots = self.__dict__.get('available_slots')
+
+    def mirror_counters(self, **changes):
+        # counter changes already written with an UPDATE, applied to this instance without saving it
+        for name, change in changes.items():
+            setattr(self, name, getattr(self, name) + change)
+        if getattr(self, '_loaded_slots', None) is not None:
+            self._loaded_slots += changes.get('available_slots', 0)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        adding = self._state.adding
+        if adding or update_fields is not None:
+            super().save(*args, **kwargs)
+            if adding or 'available_slots' in update_fields:
+                self._loaded_slots = self.__dict__.get('available_slots')
+            return
+
+        kwargs['update_fields'] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.COUNTER_FIELDS
+        ]
+        loaded = getattr(self, '_loaded_slots', None)
+        change = self.available_slots - loaded if loaded is not None and 'available_slots' in self.__dict__ else 0
+        with transaction.atomic():
+            if change:
+                # before the row save, whose post_save promotes the waitlist onto the new seats
+                Classes.objects.filter(pk=self.pk).update(available_slots=models.F('available_slots') + change)
+            super().save(*args, **kwargs)
+        self.refresh_from_db(using=self._state.db, fields=self.COUNTER_FIELDS)
 
     def __str__(self):
         return self.name    
@@ -53,20 +115,38 @@ class Bookings(models.Model):
         verbose_name = "Booking"
         verbose_name_plural = "Bookings"
         unique_together = (('client_email', 'classes'),)
+        indexes = [
+            # bookings by email, in cursor pagination order
+            models.Index(fields=['client_email', 'created_at', 'id'], name='booking_email_created_idx'),
+            # cursor pagination order for the full list
+            models.Index(fields=['created_at', 'id'], name='booking_created_idx'),
+            # seats actually taken in a class
+            models.Index(
+                fields=['classes', 'created_at'],
+                condition=models.Q(is_active=True, is_waitlisted=False),
+                name='booking_class_booked_idx'
+            ),
+            # waitlist of a class in FIFO order, for promotions
+            models.Index(
+                fields=['classes', 'created_at', 'id'],
+                condition=models.Q(is_active=True, is_waitlisted=True),
+                name='booking_class_waitlist_idx'
+            ),
+        ]
 
     # reduce slot size of class on each booking on creating the entry and 
     # if class allows waitlist allow saving the row making Waitlist as true and fail if class doesnt allow
-    
+    # the seat is claimed through the reservation engine in the same transaction as the insert
+
     def save(self, *args, **kwargs):
-        if self.classes.available_slots > 0:
-            self.classes.available_slots -= 1
-            self.classes.save()
-            super().save(*args, **kwargs)
-        elif self.classes.allow_waitlist:
-            self.is_waitlisted = True
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        from .reservations import reserve_seat
+
+        with transaction.atomic():
+            self.is_waitlisted = reserve_seat(self.classes)
             super().save(*args, **kwargs)
-        else:
-            raise ValueError("No available slots and class does not allow waitlist")
 
     def __str__(self):
         return f"{self.client_name} - {self.classes.name}"
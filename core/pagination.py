@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+# keyset (cursor) pagination for the list endpoints, every page is a range scan on an ordered column
+# so the cost of a page stays the same no matter how deep the client has scrolled
+
+class KeysetPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('created_at', 'id')
+
+class ClassesPagination(KeysetPagination):
+    ordering = ('delivery_date', 'id')
+
+class ActivitiesPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+
+class BookingsPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
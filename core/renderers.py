@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import math
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# FastJSONRenderer is the default renderer of every DRF endpoint (REST_FRAMEWORK in settings). with orjson
+# installed it encodes in C, datetimes, dates and UUIDs natively, with the same output as JSONRenderer for
+# everything the API returns. without orjson, or for output orjson can't produce or writes differently, it is
+# JSONRenderer: indent other than 2, ints over 64 bit, and decimals whose float needs an exponent or isn't
+# finite. native floats (none of the serializers returns one) are left to orjson and not looked for, walking
+# every value in python for them cost more than the encoding: 1e16 / 1e-7 come out without json's + and
+# padding (1e+16 / 1e-07) and NaN / infinities as null where JSONRenderer refuses them under STRICT_JSON
+
+# the types orjson doesn't know (decimals, lazy strings, querysets ...) are converted the way DRF does
+drf_default = JSONEncoder().default
+
+
+class UnsafeFloat(TypeError):
+    pass
+
+
+def unsafe_float(value):
+    return not math.isfinite(value) or 'e' in repr(value)
+
+def default(value):
+    # a decimal turned into a float can need the fallback too
+    value = drf_default(value)
+    if isinstance(value, float) and unsafe_float(value):
+        raise UnsafeFloat(value)
+    return value
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or data is None or indent not in (None, 2) or self.ensure_ascii or (indent is None and not self.compact):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            ret = orjson.dumps(data, default=default, option=option)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # same javascript safe escaping of U+2028 / U+2029 as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+# renderers for the streaming bookings export. the export itself writes a StreamingHttpResponse, these
+# make ?format=ndjson|csv (and the matching Accept headers) negotiable and render error responses
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode(self.charset)
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerows(row.items() if isinstance(row, dict) else [row])
+        return buffer.getvalue().encode(self.charset)
@@ -0,0 +1,75 @@
+import contextvars
+import math
+import random
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+# read replicas (DATABASE_REPLICAS, see zoomby/databases.py). a view with ReplicaReadMixin serves its GETs
+# from one replica, picked per request so all of its queries read the same copy. everything else stays on
+# default: writes, BookViewSet, the admin, management commands and any read inside a transaction. replicas
+# trail the primary, so a client that wrote reads from the primary for REPLICA_PIN_SECONDS and sees its own
+# booking: ReplicaPinMiddleware pins it on every successful write with a cookie and the same value in a
+# header, for clients without a cookie jar to send back
+
+PIN_COOKIE = 'zoomby_primary'
+PIN_HEADER = 'X-Zoomby-Primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# the replica the running request reads from, None for the primary
+current = contextvars.ContextVar('zoomby_replica', default=None)
+
+def pinned(request):
+    # the pin is the unix time it runs out at
+    value = request.COOKIES.get(PIN_COOKIE) or request.headers.get(PIN_HEADER)
+    try:
+        return float(value) > time.time()
+    except (TypeError, ValueError):
+        return False
+
+def pick_replica(request):
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    if not replicas or request.method not in SAFE_METHODS or pinned(request):
+        return None
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = current.get()
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # also for rows that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the primary's rows
+        return True
+
+
+class ReplicaReadMixin:
+    # GETs of the viewset read from a replica unless the client is pinned
+
+    def dispatch(self, request, *args, **kwargs):
+        token = current.set(pick_replica(request))
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            current.reset(token)
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            return response
+        seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        until = str(math.ceil(time.time() + seconds))
+        response.set_cookie(PIN_COOKIE, until, max_age=seconds, httponly=True, samesite='Lax')
+        response[PIN_HEADER] = until
+        return response
@@ -0,0 +1,373 @@
+import logging
+from collections import defaultdict
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+from .availability import publish
+from .cache import CLASSES, bump_version
+from .models import Bookings, Classes
+
+# logger
+logger = logging.getLogger(__name__)
+
+# seat reservation engine, every change to Classes.available_slots made by a booking goes through here
+# so that a seat is claimed with a single conditional UPDATE instead of read / decrement / save in python.
+# the denormalized Classes.booked_count and waitlist_count are moved in the same statements
+
+MAX_CLAIM_RETRIES = 10
+PROMOTION_BATCH_SIZE = 500
+COUNTER_BATCH_SIZE = 250
+RECONCILE_BATCH_SIZE = 1000
+
+BOOKED = 'booked'
+WAITLISTED = 'waitlisted'
+REJECTED = 'rejected'
+
+class NoSlotsAvailable(ValueError):
+    """Raised when a class has no free seat left and does not allow waitlist."""
+
+
+def update_counters(deltas):
+    # deltas is {class_id: {field: change}} for available_slots, booked_count and waitlist_count. every
+    # field is moved relative to its current value with F() + CASE, one UPDATE per batch of classes
+    deltas = {class_id: changes for class_id, changes in deltas.items() if any(changes.values())}
+    class_ids = list(deltas)
+    now = timezone.now()
+    for start in range(0, len(class_ids), COUNTER_BATCH_SIZE):
+        batch = class_ids[start:start + COUNTER_BATCH_SIZE]
+        fields = {name for class_id in batch for name, change in deltas[class_id].items() if change}
+        values = {
+            name: F(name) + Case(
+                *(When(pk=class_id, then=Value(deltas[class_id].get(name, 0))) for class_id in batch),
+                default=Value(0),
+                output_field=IntegerField()
+            )
+            for name in fields
+        }
+        Classes.objects.filter(pk__in=batch).update(updated_at=now, **values)
+        publish(*batch)
+    if class_ids:
+        # the counters are part of the class pages and their validators
+        bump_version(CLASSES)
+
+
+def claim_seat(class_id):
+    # take one seat if there is one left, the WHERE clause makes the check and the decrement a single
+    # atomic statement on every backend so two concurrent bookings can never take the same last seat
+    claimed = Classes.objects.filter(pk=class_id, available_slots__gt=0).update(
+        available_slots=F('available_slots') - 1,
+        booked_count=F('booked_count') + 1,
+        updated_at=timezone.now()
+    )
+    if claimed:
+        bump_version(CLASSES)
+        publish(class_id)
+    return claimed == 1
+
+
+def claim_seats(class_id, count):
+    # take up to `count` seats in one go and return how many were granted. the row is locked with
+    # select_for_update where the backend has row locks, otherwise the update only goes through if the
+    # slot value is still the one we read and we retry with the fresh value
+    if count <= 0:
+        return 0
+    if count == 1:
+        return 1 if claim_seat(class_id) else 0
+
+    with transaction.atomic(savepoint=False):
+        for _ in range(MAX_CLAIM_RETRIES):
+            available = (
+                Classes.objects.select_for_update()
+                .filter(pk=class_id)
+                .values_list('available_slots', flat=True)
+                .first()
+            )
+            if not available or available <= 0:
+                return 0
+            granted = min(available, count)
+            updated = Classes.objects.filter(pk=class_id, available_slots=available).update(
+                available_slots=F('available_slots') - granted,
+                booked_count=F('booked_count') + granted,
+                updated_at=timezone.now()
+            )
+            if updated:
+                bump_version(CLASSES)
+                publish(class_id)
+                return granted
+
+    logger.warning(f"Gave up claiming {count} seats for class {class_id} after {MAX_CLAIM_RETRIES} retries")
+    return 0
+
+
+def reserve_seat(classes):
+    # claim a seat for a new booking or fall back to the waitlist, returns True when the booking has to be
+    # waitlisted. callers run this in the same transaction as the booking insert so a failed insert
+    # gives the seat back on rollback
+
+    if claim_seat(classes.pk):
+        # mirror the claim on the instance the caller holds, without saving it back
+        classes.mirror_counters(available_slots=-1, booked_count=1)
+        return False
+    if classes.allow_waitlist:
+        logger.info(f"Class {classes.pk} is full, booking goes to waitlist")
+        Classes.objects.filter(pk=classes.pk).update(
+            waitlist_count=F('waitlist_count') + 1,
+            updated_at=timezone.now()
+        )
+        bump_version(CLASSES)
+        publish(classes.pk)
+        classes.mirror_counters(waitlist_count=1)
+        return True
+    raise NoSlotsAvailable("No available slots and class does not allow waitlist")
+
+
+def taken_pairs(class_ids, emails):
+    return set(
+        Bookings.objects.filter(classes_id__in=class_ids, client_email__in=emails)
+        .values_list('client_email', 'classes_id')
+    )
+
+
+def place_bookings(items, pending, granted, classes_map, results, user):
+    # the first `granted` items of a class get the seats claimed for it, the rest go to the waitlist or are
+    # rejected. seats claimed for items that were dropped since go back. returns the bookings to insert and
+    # the counter deltas per class
+    new_bookings = []
+    deltas = {}
+    for class_id, indexes in pending.items():
+        classes = classes_map[class_id]
+        seats = granted[class_id]
+        deltas[class_id] = {'waitlist_count': 0}
+        if seats > len(indexes):
+            deltas[class_id].update(available_slots=seats - len(indexes), booked_count=len(indexes) - seats)
+        for position, index in enumerate(indexes):
+            if position < seats:
+                is_waitlisted = False
+            elif classes.allow_waitlist:
+                is_waitlisted = True
+                deltas[class_id]['waitlist_count'] += 1
+            else:
+                results[index] = {
+                    'index': index,
+                    'status': REJECTED,
+                    'error': 'No available slots and class does not allow waitlist'
+                }
+                continue
+            item = items[index]
+            new_bookings.append((index, Bookings(
+                client_name=item['client_name'],
+                client_email=item['client_email'],
+                classes=classes,
+                is_waitlisted=is_waitlisted,
+                created_by=user,
+                updated_by=user
+            )))
+    return new_bookings, deltas
+
+
+def book_many(items, user):
+    # book a batch of validated items ({client_name, client_email, classes}) in one transaction: one query
+    # for the classes, one for already existing bookings, one seat claim per class and one bulk insert.
+    # returns one result per item in input order, items that can't be booked are rejected individually
+
+    results = [None] * len(items)
+    class_ids = {item['classes'] for item in items}
+    emails = {item['client_email'] for item in items}
+
+    with transaction.atomic():
+        # the class rows are locked before the duplicate check. a single booking claims its seat on the class
+        # row before inserting, so it either committed before `taken` is read or waits for this batch
+        classes_map = Classes.objects.select_for_update().in_bulk(class_ids)
+        taken = taken_pairs(class_ids, emails)
+
+        pending = defaultdict(list)
+        for index, item in enumerate(items):
+            key = (item['client_email'], item['classes'])
+            if item['classes'] not in classes_map:
+                results[index] = {'index': index, 'status': REJECTED, 'error': 'Class does not exist.'}
+            elif key in taken:
+                results[index] = {'index': index, 'status': REJECTED, 'error': 'Already booked for this class.'}
+            else:
+                taken.add(key)
+                pending[item['classes']].append(index)
+
+        granted = {class_id: claim_seats(class_id, len(indexes)) for class_id, indexes in pending.items()}
+        new_bookings, deltas = place_bookings(items, pending, granted, classes_map, results, user)
+        try:
+            # bulk_create skips Bookings.save, the seats were already claimed above
+            with transaction.atomic():
+                Bookings.objects.bulk_create([booking for _, booking in new_bookings])
+        except IntegrityError:
+            # a writer that doesn't lock the class booked one of the pairs after `taken` was read. those items
+            # are rejected and the rest placed again on the seats already claimed
+            taken = taken_pairs(list(pending), emails)
+            for class_id, indexes in pending.items():
+                for index in indexes:
+                    if (items[index]['client_email'], class_id) in taken:
+                        results[index] = {'index': index, 'status': REJECTED, 'error': 'Already booked for this class.'}
+                pending[class_id] = [index for index in indexes if (items[index]['client_email'], class_id) not in taken]
+            new_bookings, deltas = place_bookings(items, pending, granted, classes_map, results, user)
+            Bookings.objects.bulk_create([booking for _, booking in new_bookings])
+        update_counters(deltas)
+        # seats handed back by dropped items move the waitlist up
+        released = [class_id for class_id, changes in deltas.items() if changes.get('available_slots')]
+        if released:
+            promote_waitlists(released)
+
+    for index, booking in new_bookings:
+        results[index] = {
+            'index': index,
+            'status': WAITLISTED if booking.is_waitlisted else BOOKED,
+            'id': booking.pk,
+            'classes': booking.classes_id
+        }
+    return results
+
+
+def promote_waitlists(class_ids):
+    # move the oldest waitlisted bookings (FIFO by created_at) of every given class onto free seats, in
+    # one transaction. the class rows are locked first so bookings and other promotions wait for us, each
+    # class reads at most as many waitlisted rows as it has free seats through the partial waitlist index,
+    # and all promotions and counter changes are written with one UPDATE each. returns {class_id: promoted}
+
+    promoted = {}
+    class_ids = list(class_ids)
+    if not class_ids:
+        return promoted
+
+    with transaction.atomic():
+        for start in range(0, len(class_ids), PROMOTION_BATCH_SIZE):
+            batch = class_ids[start:start + PROMOTION_BATCH_SIZE]
+            free_seats = dict(
+                Classes.objects.select_for_update()
+                .filter(pk__in=batch, is_active=True, available_slots__gt=0)
+                .values_list('id', 'available_slots')
+            )
+
+            booking_ids = []
+            for class_id, seats in free_seats.items():
+                waiting = list(
+                    Bookings.objects.filter(classes_id=class_id, is_active=True, is_waitlisted=True)
+                    .order_by('created_at', 'id')
+                    .values_list('id', flat=True)[:seats]
+                )
+                if waiting:
+                    promoted[class_id] = len(waiting)
+                    booking_ids += waiting
+
+            if not booking_ids:
+                continue
+            now = timezone.now()
+            # ids in chunks that stay under the backend's query parameter limit
+            step = connection.features.max_query_params or len(booking_ids)
+            for offset in range(0, len(booking_ids), step):
+                Bookings.objects.filter(id__in=booking_ids[offset:offset + step]).update(
+                    is_waitlisted=False, updated_at=now
+                )
+            update_counters({
+                class_id: {'available_slots': -count, 'booked_count': count, 'waitlist_count': -count}
+                for class_id, count in promoted.items() if class_id in free_seats
+            })
+
+    if promoted:
+        bump_version(CLASSES)
+        logger.info(f"Promoted {sum(promoted.values())} waitlisted bookings in {len(promoted)} classes")
+    return promoted
+
+
+def promote_waitlist(class_id):
+    return promote_waitlists([class_id]).get(class_id, 0)
+
+
+def cancel_bookings(booking_ids=None, class_ids=None, close_classes=False):
+    # cancel bookings by id and / or every active booking of whole classes. the bookings are deactivated
+    # with one set based UPDATE, the seats and counters go back with one UPDATE for all classes and the freed
+    # seats are handed to the waitlist in the same transaction. close_classes also deactivates the
+    # classes, which then keep their seats and skip the promotion
+
+    if not booking_ids and not class_ids:
+        return {'cancelled': 0, 'seats_released': 0, 'promoted': 0}
+
+    selection = Q()
+    if booking_ids:
+        selection |= Q(id__in=booking_ids)
+    if class_ids:
+        selection |= Q(classes_id__in=class_ids)
+
+    with transaction.atomic():
+        bookings = Bookings.objects.filter(selection, is_active=True)
+        affected = set(bookings.order_by().values_list('classes_id', flat=True).distinct())
+        # lock the classes first so concurrent bookings and cancellations of them wait for us
+        list(Classes.objects.select_for_update().filter(pk__in=affected).values_list('id', flat=True))
+        if close_classes and class_ids:
+            Classes.objects.filter(pk__in=class_ids).update(is_active=False, updated_at=timezone.now())
+
+        seats = {}
+        deltas = defaultdict(dict)
+        for class_id, is_waitlisted, count in (
+            bookings.order_by().values('classes_id', 'is_waitlisted').annotate(count=Count('id'))
+            .values_list('classes_id', 'is_waitlisted', 'count')
+        ):
+            if is_waitlisted:
+                deltas[class_id]['waitlist_count'] = -count
+            else:
+                seats[class_id] = count
+                deltas[class_id].update(available_slots=count, booked_count=-count)
+        cancelled = bookings.update(is_active=False, updated_at=timezone.now())
+        update_counters(deltas)
+        promoted = promote_waitlists(seats) if seats else {}
+
+    if deltas or close_classes:
+        bump_version(CLASSES)
+    result = {
+        'cancelled': cancelled,
+        'seats_released': sum(seats.values()),
+        'promoted': sum(promoted.values()),
+    }
+    logger.info(f"Cancelled bookings: {result}")
+    return result
+
+
+def reconcile_counters(class_ids=None, batch_size=RECONCILE_BATCH_SIZE, fix=True):
+    # recompute booked_count and waitlist_count from the active bookings, a batch of classes at a time.
+    # every batch locks its class rows, counts their bookings with one grouped query and writes the
+    # drifted rows back with bulk_update. returns [(class_id, (booked, waitlist), (actual booked, waitlist))]
+    # for every drifted class. available_slots is not checked, the capacity of a class isn't stored
+    classes = Classes.objects.order_by('id')
+    if class_ids:
+        classes = classes.filter(pk__in=class_ids)
+    ids = list(classes.values_list('id', flat=True))
+
+    drift = []
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            stored = {
+                class_id: (booked, waitlist)
+                for class_id, booked, waitlist in Classes.objects.select_for_update().filter(pk__in=batch)
+                .values_list('id', 'booked_count', 'waitlist_count')
+            }
+            actual = {class_id: [0, 0] for class_id in stored}
+            for class_id, is_waitlisted, count in (
+                Bookings.objects.filter(classes_id__in=batch, is_active=True).order_by()
+                .values('classes_id', 'is_waitlisted').annotate(count=Count('id'))
+                .values_list('classes_id', 'is_waitlisted', 'count')
+            ):
+                actual[class_id][1 if is_waitlisted else 0] = count
+
+            drifted = [
+                (class_id, stored[class_id], tuple(counts))
+                for class_id, counts in actual.items() if tuple(counts) != stored[class_id]
+            ]
+            if fix and drifted:
+                Classes.objects.bulk_update(
+                    [Classes(pk=class_id, booked_count=booked, waitlist_count=waitlist)
+                     for class_id, _, (booked, waitlist) in drifted],
+                    ['booked_count', 'waitlist_count']
+                )
+                publish(*(class_id for class_id, _, _ in drifted))
+        drift += drifted
+
+    if fix and drift:
+        bump_version(CLASSES)
+    return drift
@@ -1,16 +1,40 @@
 import pytz
+from functools import lru_cache
 from rest_framework import serializers
 from .models import *
+from .reservations import NoSlotsAvailable
 from django.utils import timezone
 
 # all the model's serializers are created.
 
+# sparse fieldsets, GET ?fields=id,name,available_slots only serializes (and computes) the listed fields
+class DynamicFieldsMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        allowed = {name.strip() for name in requested.split(',') if name.strip()}
+        for field_name in set(self.fields) - allowed:
+            self.fields.pop(field_name)
+
+# tz objects by name, unknown names resolve to None
+@lru_cache(maxsize=128)
+def lookup_timezone(tzname):
+    try:
+        return pytz.timezone(tzname)
+    except pytz.UnknownTimeZoneError:
+        return None
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
 
-class ClassesSerializer(serializers.ModelSerializer):
+class ClassesSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     
     delivery_date_local = serializers.SerializerMethodField()
     cutoff_date_local = serializers.SerializerMethodField()
@@ -20,15 +44,23 @@ class ClassesSerializer(serializers.ModelSerializer):
     class Meta:
         model = Classes
         fields = '__all__'  
-        read_only_fields = ('server_timezone', 'server_time','delivery_date_local', 'cutoff_date_local')
+        read_only_fields = ('server_timezone', 'server_time','delivery_date_local', 'cutoff_date_local', 'booked_count', 'waitlist_count')
 
-    def get_timezone(self):
+    # values that are the same for every row of a response are computed once per request and kept in
+    # the serializer context, which a many=True list shares with its child serializer
+    def request_constant(self, name, compute):
+        constants = self.context.setdefault('_request_constants', {})
+        if name not in constants:
+            constants[name] = compute()
+        return constants[name]
+
+    def resolve_timezone(self):
         request = self.context.get('request')
         tzname = request.query_params.get('tz') if request else None
-        try:
-            return pytz.timezone(tzname) if tzname else timezone.get_current_timezone()
-        except pytz.UnknownTimeZoneError:
-            return timezone.get_current_timezone()
+        return (tzname and lookup_timezone(tzname)) or timezone.get_current_timezone()
+
+    def get_timezone(self):
+        return self.request_constant('timezone', self.resolve_timezone)
 
     def convert_to_user_timezone(self, dt):
         if not dt:
@@ -45,17 +77,17 @@ class ClassesSerializer(serializers.ModelSerializer):
         return self.convert_to_user_timezone(obj.cutoff_date)
     
     def get_server_timezone(self, obj):
-        return str(timezone.get_current_timezone())
+        return self.request_constant('server_timezone', lambda: str(timezone.get_current_timezone()))
 
     def get_server_time(self, obj):
-        return timezone.now().isoformat()
+        return self.request_constant('server_time', lambda: timezone.now().isoformat())
 
-class ActivitiesSerializer(serializers.ModelSerializer):
+class ActivitiesSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Activities
         fields = '__all__'
 
-class BookingsSerializer(serializers.ModelSerializer):
+class BookingsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Bookings
         fields = '__all__'
@@ -73,13 +105,26 @@ class BookSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("No available slots and class does not allow waitlist")
         return data
     
-    # preventing over booking and waitlisting if allowed
+    # preventing over booking and waitlisting if allowed, the seat itself is claimed atomically
+    # by Bookings.save through the reservation engine so validate() above is only an early reject
     def create(self, validated_data):
-        classes = validated_data['classes']
-        if classes.available_slots > 0:
-            classes.available_slots -= 1
-            classes.save()
-            validated_data['is_waitlisted'] = False
-        else:
-            validated_data['is_waitlisted'] = True 
-        return super().create(validated_data)
\ No newline at end of file
+        try:
+            return super().create(validated_data)
+        except NoSlotsAvailable as e:
+            raise serializers.ValidationError(str(e))
+
+# one item of a bulk booking, classes is a plain id here so a batch is validated without a query per item
+class BulkBookItemSerializer(serializers.Serializer):
+    client_name = serializers.CharField(max_length=100, default="Micheal Scott")
+    client_email = serializers.EmailField(max_length=254)
+    classes = serializers.IntegerField(min_value=1)
+
+# bulk cancellation by booking ids and / or whole classes
+class CancelBookingsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=1000)
+    classes = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=100)
+
+    def validate(self, data):
+        if not data.get('ids') and not data.get('classes'):
+            raise serializers.ValidationError("Provide booking ids or classes to cancel.")
+        return data
@@ -0,0 +1,49 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .availability import publish
+from .cache import ACTIVITIES, CLASSES, bump_version
+from .models import Activities, Classes
+from .reservations import promote_waitlist
+
+# write-through invalidation of the listing cache for model saves and deletes (api, admin, organizer).
+# slot changes made with queryset.update() don't send signals, the reservation engine bumps those itself
+
+@receiver([post_save, post_delete], sender=Classes)
+def classes_changed(sender, **kwargs):
+    bump_version(CLASSES)
+
+# more seats on an existing class move waiting bookings up right away
+@receiver(post_save, sender=Classes)
+def promote_on_class_change(sender, instance, created, **kwargs):
+    if created:
+        return
+    publish(instance.pk)
+    promoted = promote_waitlist(instance.pk)
+    if promoted:
+        instance.mirror_counters(available_slots=-promoted, booked_count=promoted, waitlist_count=-promoted)
+
+# the activity ids are part of a class, changing them moves updated_at so the class gets a new ETag
+def touch_classes(classes):
+    classes.update(updated_at=timezone.now())
+
+@receiver(m2m_changed, sender=Classes.activities.through)
+def class_activities_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    bump_version(CLASSES)
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch_classes(Classes.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        touch_classes(Classes.objects.filter(activities=instance))
+    else:
+        touch_classes(Classes.objects.filter(pk__in=pk_set))
+
+# classes list their activity ids, deleting an activity changes those lists too
+@receiver(pre_delete, sender=Activities)
+def activity_deleted(sender, instance, **kwargs):
+    touch_classes(Classes.objects.filter(activities=instance))
+
+@receiver([post_save, post_delete], sender=Activities)
+def activities_changed(sender, **kwargs):
+    bump_version(ACTIVITIES, CLASSES)
@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import *
 from . import views
+from . import async_views
 
 app_name = 'core'
 
@@ -15,4 +16,9 @@ router.register(r'book', BookViewSet, basename='book')
 urlpatterns = [
 #   path('core/', views.my_view, name='mv'),
     path('api/v1.0/', include(router.urls)),
+    # async read path, served natively when running under ASGI
+    path('api/v1.0/async/classes/', async_views.class_list, name='async-classes-list'),
+    path('api/v1.0/async/classes/<int:pk>/', async_views.class_detail, name='async-classes-detail'),
+    path('api/v1.0/async/bookings/', async_views.bookings_by_email, name='async-bookings-list'),
+    path('api/v1.0/async/classes/availability/stream/', async_views.availability_stream, name='async-availability-stream'),
 ]
\ No newline at end of file
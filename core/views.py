@@ -1,14 +1,29 @@
 import logging
-from django.contrib.auth.models import User
 from django.core.validators import validate_email
+from django.db import router
+from django.db.models import Prefetch, Q
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.decorators import action
 from .models import *
 from .serializers import *
-from django.http import JsonResponse
+from .reservations import REJECTED, book_many, cancel_bookings
+from .pagination import ActivitiesPagination, BookingsPagination, ClassesPagination
+from .availability import AVAILABILITY_FIELDS
+from .cache import ACTIVITIES, CLASSES, CachedReadMixin
+from .conditional import ConditionalReadMixin
+from .replicas import ReplicaReadMixin
+from .fastpath import ActivitiesValuesSerializer, BookingsValuesSerializer, ClassesValuesSerializer, FastListMixin
+from .actors import acting_user
+from .idempotency import idempotent
+from .logs import Payload
+from django.utils import timezone
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from .exports import csv_lines, export_rows, ndjson_lines
+from .renderers import CSVRenderer, NDJSONRenderer
 from rest_framework.response import Response
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from rest_framework import filters
 from rest_framework.exceptions import MethodNotAllowed
 from django.core.exceptions import ValidationError
@@ -23,49 +38,209 @@ def is_valid_email_regex(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
-class ClassesViewSet(viewsets.ModelViewSet):
-    queryset = Classes.objects.all()
+# date or datetime query params, a bare end date covers that whole day. the date is tried first,
+# parse_datetime reads a bare date as its midnight
+def parse_moment(value, end_of_day=False):
+    try:
+        day = parse_date(value)
+        moment = parse_datetime(value) if day is None else None
+    except ValueError:
+        return None
+    if day is not None:
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if moment is None:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+# ?ids=1,2,3 of the availability endpoints, returns (ids, error message)
+def parse_class_ids(value, limit):
+    try:
+        ids = {int(part) for part in value.split(',') if part.strip()}
+    except ValueError:
+        return None, 'ids must be a comma separated list of class ids.'
+    if not ids:
+        return None, 'ids query parameter is required.'
+    if len(ids) > limit:
+        return None, f'At most {limit} classes per request.'
+    return ids, None
+
+# ?is_active= / ?bookable= flags, returns None for anything else
+def parse_flag(value):
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return None
+
+CLASS_FILTER_MAX_DAYS = 366
+CLASS_FILTER_MAX_IDS = 100
+
+# class search, returns (conditions, error message). every filter has an index behind it:
+#   delivery_from / delivery_to   ISO date or datetime, class_delivery_idx
+#   next_days=N                   delivery within the next N days, computed here so the page is cached under
+#                                 the same key for every client (the window trails by LISTING_CACHE_TIMEOUT at most)
+#   is_active                     class_active_delivery_idx / class_inactive_delivery_idx
+#   bookable                      open for booking now: active, upcoming, before the cutoff and a seat or the
+#                                 waitlist left, class_active_delivery_idx
+#   activities                    comma separated ids, classes with any of them, through table index
+#   instructor                    user id, class_instructor_delivery_idx
+def parse_class_filters(params):
+    conditions = []
+    now = timezone.now()
+
+    for param, lookup in (('delivery_from', 'delivery_date__gte'), ('delivery_to', 'delivery_date__lte')):
+        value = params.get(param)
+        if not value:
+            continue
+        moment = parse_moment(value, end_of_day=(param == 'delivery_to'))
+        if moment is None:
+            return None, f'Invalid {param}, expected an ISO date or datetime.'
+        conditions.append(Q(**{lookup: moment}))
+
+    days = params.get('next_days')
+    if days:
+        if not days.isdigit() or not 1 <= int(days) <= CLASS_FILTER_MAX_DAYS:
+            return None, f'next_days must be a number of days between 1 and {CLASS_FILTER_MAX_DAYS}.'
+        conditions.append(Q(delivery_date__gte=now, delivery_date__lt=now + timedelta(days=int(days))))
+
+    for param in ('is_active', 'bookable'):
+        value = params.get(param)
+        if not value:
+            continue
+        flag = parse_flag(value)
+        if flag is None:
+            return None, f'{param} must be true or false.'
+        if param == 'is_active':
+            conditions.append(Q(is_active=flag))
+            continue
+        # a class that already took place isn't bookable whatever its cutoff, which also lets the page start
+        # at now in the delivery index instead of walking past classes
+        bookable = Q(is_active=True, cutoff_date__gt=now, delivery_date__gt=now) & (Q(available_slots__gt=0) | Q(allow_waitlist=True))
+        conditions.append(bookable if flag else ~bookable)
+
+    value = params.get('activities')
+    if value:
+        try:
+            ids = {int(part) for part in value.split(',') if part.strip()}
+        except ValueError:
+            return None, 'activities must be a comma separated list of activity ids.'
+        if len(ids) > CLASS_FILTER_MAX_IDS:
+            return None, f'At most {CLASS_FILTER_MAX_IDS} activities per request.'
+        # a subquery on the through table instead of a join, a class with several matches is listed once
+        through = Classes.activities.through.objects.filter(activities_id__in=ids).values('classes_id')
+        conditions.append(Q(id__in=through))
+
+    value = params.get('instructor')
+    if value:
+        if not value.isdigit():
+            return None, 'Invalid instructor id.'
+        conditions.append(Q(instructor_id=int(value)))
+
+    return conditions, None
+
+# server_time is the time of the response, not of the cached page
+def refresh_server_time(data):
+    rows = data['results'] if 'results' in data else [data]
+    server_time = timezone.now().isoformat()
+    for row in rows:
+        if 'server_time' in row:
+            row['server_time'] = server_time
+    return data
+
+AVAILABILITY_LIMIT = 500
+
+class ClassesViewSet(ReplicaReadMixin, ConditionalReadMixin, CachedReadMixin, FastListMixin, viewsets.ModelViewSet):
+    # activities is serialized as a list of ids, prefetching only the ids keeps a page at two queries.
+    # ordered by id, the same order the list fast path reads them in
+    queryset = Classes.objects.prefetch_related(
+        Prefetch('activities', queryset=Activities.objects.only('id').order_by('id'))
+    )
     serializer_class = ClassesSerializer
+    values_serializer_class = ClassesValuesSerializer
+    pagination_class = ClassesPagination
+    cache_namespace = CLASSES
+    filter_conditions = ()
+
+    # ?delivery_from= &delivery_to= &next_days= &is_active= &bookable= &activities= &instructor=, checked before
+    # the cache and the validators, which see them through filter_queryset
+    def list(self, request, *args, **kwargs):
+        conditions, message = parse_class_filters(request.query_params)
+        if message:
+            return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
+        self.filter_conditions = conditions
+        return super().list(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        return super().filter_queryset(queryset).filter(*self.filter_conditions)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+
+    def refresh_cached_data(self, data):
+        return refresh_server_time(data)
+
+    # seat counters of many classes in one query, for clients that poll availability. not cached, the
+    # counters change with every booking
+    @action(detail=False, methods=['get'], url_path='availability')
+    def availability(self, request, *args, **kwargs):
+        ids, message = parse_class_ids(request.query_params.get('ids', ''), AVAILABILITY_LIMIT)
+        if message:
+            return Response({'error': message}, status=status.HTTP_400_BAD_REQUEST)
+        rows = Classes.objects.filter(pk__in=ids).order_by('id').values(*AVAILABILITY_FIELDS)
+        return Response({'results': list(rows)})
     
     def create(self, request, *args, **kwargs):
-        logger.info(f"POST request data: {request.data}")
+        logger.info("POST request data: %s", Payload(request.data))
         
         response = super().create(request, *args, **kwargs)
         
         if response.status_code == status.HTTP_201_CREATED:
-            logger.info(f"Created new class: {response.data}")
+            logger.info("Created new class: %s", Payload(response.data))
         else:
-            logger.warning(f"Failed to create class: {response.data}")
+            logger.warning("Failed to create class: %s", Payload(response.data))
         
         return response
     
-class ActivitiesViewSet(viewsets.ModelViewSet):
+class ActivitiesViewSet(ReplicaReadMixin, ConditionalReadMixin, CachedReadMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Activities.objects.all()
     serializer_class = ActivitiesSerializer
+    values_serializer_class = ActivitiesValuesSerializer
+    pagination_class = ActivitiesPagination
+    cache_namespace = ACTIVITIES
 
     def create(self, request, *args, **kwargs):
-        logger.info(f"POST request data: {request.data}")
+        logger.info("POST request data: %s", Payload(request.data))
         
         response = super().create(request, *args, **kwargs)
         
         if response.status_code == status.HTTP_201_CREATED:
-            logger.info(f"Created new activity: {response.data}")
+            logger.info("Created new activity: %s", Payload(response.data))
         else:
-            logger.warning(f"Failed to create activity: {response.data}")
+            logger.warning("Failed to create activity: %s", Payload(response.data))
         
         return response
     
-class BookingsViewSet(viewsets.ModelViewSet):
+class BookingsViewSet(ReplicaReadMixin, ConditionalReadMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Bookings.objects.all()
     serializer_class = BookingsSerializer
-    http_method_names = ['get']
+    values_serializer_class = BookingsValuesSerializer
+    pagination_class = BookingsPagination
+    # post only for the cancel actions, create itself is rejected below
+    http_method_names = ['get', 'post']
 
     def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.list_bookings, self.list_validators, request, *args, **kwargs)
+
+    def list_queryset(self, request):
+        email = request.query_params.get('email', None)
+        return self.queryset.filter(client_email=email) if email else self.queryset.all()
+
+    def list_bookings(self, request, *args, **kwargs):
         email = request.query_params.get('email', None)
 
         if email:
@@ -88,8 +263,75 @@ class BookingsViewSet(viewsets.ModelViewSet):
         else:
             bookings = self.queryset.all()
 
-        serializer = self.get_serializer(bookings, many=True)
-        return Response(serializer.data)
+        return self.paginated_list(bookings)
+
+    # streaming export for finance, /bookings/export/?format=ndjson|csv
+    # filters: class, email, created_from / created_to (ISO date or datetime)
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        bookings = self.queryset.all()
+        params = request.query_params
+
+        email = params.get('email')
+        if email:
+            try:
+                validate_email(email)
+            except ValidationError:
+                return Response({'error': 'Invalid email address.'}, status=status.HTTP_400_BAD_REQUEST)
+            bookings = bookings.filter(client_email=email)
+
+        class_id = params.get('class')
+        if class_id:
+            if not class_id.isdigit():
+                return Response({'error': 'Invalid class id.'}, status=status.HTTP_400_BAD_REQUEST)
+            bookings = bookings.filter(classes_id=int(class_id))
+
+        for param, lookup in (('created_from', 'created_at__gte'), ('created_to', 'created_at__lte')):
+            value = params.get(param)
+            if not value:
+                continue
+            moment = parse_moment(value, end_of_day=(param == 'created_to'))
+            if moment is None:
+                return Response({'error': f'Invalid {param}, expected an ISO date or datetime.'}, status=status.HTTP_400_BAD_REQUEST)
+            bookings = bookings.filter(**{lookup: moment})
+
+        logger.info(f"Bookings export as {request.accepted_renderer.format}: {dict(params)}")
+        # the rows are read while the response streams, after dispatch has reset the replica choice, so the
+        # database is bound now
+        rows = export_rows(bookings.using(router.db_for_read(Bookings)))
+        if request.accepted_renderer.format == 'csv':
+            response = StreamingHttpResponse(csv_lines(rows), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="bookings.csv"'
+        else:
+            response = StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson; charset=utf-8')
+        return response
+
+    # cancel a single booking, its seat goes back to the class (and on to the waitlist)
+    @action(detail=True, methods=['post'], url_path='cancel')
+    def cancel(self, request, *args, **kwargs):
+        booking = self.get_object()
+        if not booking.is_active:
+            return Response({'error': 'Booking is already cancelled.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = cancel_bookings(booking_ids=[booking.pk])
+        logger.info(f"Cancelled booking {booking.pk}: {result}")
+        return Response(result)
+
+    # bulk cancel: {"ids": [...]} for a list of bookings and / or {"classes": [...]} to close whole classes,
+    # closing a class cancels all its bookings and deactivates it
+    @action(detail=False, methods=['post'], url_path='cancel')
+    def cancel_many(self, request, *args, **kwargs):
+        logger.info("POST cancel request data: %s", Payload(request.data))
+        serializer = CancelBookingsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result = cancel_bookings(
+            booking_ids=serializer.validated_data.get('ids'),
+            class_ids=serializer.validated_data.get('classes'),
+            close_classes=True
+        )
+        return Response(result)
 
     def create(self, request, *args, **kwargs):
         raise MethodNotAllowed("POST")
@@ -104,31 +346,75 @@ class BookingsViewSet(viewsets.ModelViewSet):
         raise MethodNotAllowed("DELETE")
 
 # as per requirement only post with client email, name and class id 
+# bulk booking takes a list of the same items (or {"bookings": [...]}) and books them in one transaction
+
+BULK_BOOKING_LIMIT = 500
 
 class BookViewSet(viewsets.ModelViewSet):
     queryset = Classes.objects.all()
     serializer_class = BookSerializer
     http_method_names = ['post']
 
+    # retries with the same Idempotency-Key header get the first response back
+    @idempotent('book')
     def create(self, request, *args, **kwargs):
-        logger.info(f"POST request data: {request.data}")
+        logger.info("POST request data: %s", Payload(request.data))
         
         response = super().create(request, *args, **kwargs)
         
         if response.status_code == status.HTTP_201_CREATED:
-            logger.info(f"Created new booking: {response.data}")
+            logger.info("Created new booking: %s", Payload(response.data))
         else:
-            logger.warning(f"Failed to create booking: {response.data}")
+            logger.warning("Failed to create booking: %s", Payload(response.data))
         
         return response
     
     def perform_create(self, serializer):
-        user = User.objects.filter(is_superuser=True).first()
+        user = acting_user(self.request)
         serializer.save(
             created_by=user,
             updated_by=user
         )
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @idempotent('book-bulk')
+    def bulk(self, request, *args, **kwargs):
+        logger.info("POST bulk request data: %s", Payload(request.data))
+
+        payload = request.data.get('bookings') if isinstance(request.data, dict) else request.data
+        if not isinstance(payload, list) or not payload:
+            return Response(
+                {'error': 'Expected a non empty list of bookings.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(payload) > BULK_BOOKING_LIMIT:
+            return Response(
+                {'error': f'At most {BULK_BOOKING_LIMIT} bookings per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = [None] * len(payload)
+        valid_items, positions = [], []
+        for index, raw in enumerate(payload):
+            item = BulkBookItemSerializer(data=raw)
+            if item.is_valid():
+                valid_items.append(item.validated_data)
+                positions.append(index)
+            else:
+                results[index] = {'index': index, 'status': REJECTED, 'error': item.errors}
+
+        if valid_items:
+            user = acting_user(request)
+            for position, result in zip(positions, book_many(valid_items, user)):
+                result['index'] = position
+                results[position] = result
+
+        rejected = sum(1 for result in results if result['status'] == REJECTED)
+        logger.info(f"Bulk booking finished: {len(results) - rejected} created, {rejected} rejected")
+
+        response_status = status.HTTP_207_MULTI_STATUS if rejected else status.HTTP_201_CREATED
+        return Response({'results': results}, status=response_status)
+
     def list(self, request, *args, **kwargs):
         raise MethodNotAllowed("GET")
 
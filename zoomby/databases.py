@@ -0,0 +1,104 @@
+import copy
+import os
+from django.core.exceptions import ImproperlyConfigured
+
+# database profiles, picked with ZOOMBY_DB_PROFILE
+#   sqlite      development default, rollback journal and a new connection per request
+#   sqlite-wal  single node production: WAL journal (readers no longer wait for the writer and the writer
+#               doesn't wait for readers), synchronous=NORMAL, a bigger page cache and persistent connections
+#               with health checks
+#   postgres    ZOOMBY_DB_NAME / USER / PASSWORD / HOST / PORT through psycopg 3's connection pool
+#               (ZOOMBY_DB_POOL_MIN / ZOOMBY_DB_POOL_MAX), ZOOMBY_DB_POOL=0 keeps persistent connections instead
+# ZOOMBY_DB_CONN_MAX_AGE replaces the seconds a persistent connection is kept. under ASGI prefer the pool,
+# persistent connections are per thread and the async views run on a pool of threads
+# ZOOMBY_DB_REPLICAS adds read replicas as replica1, replica2 ... (core/replicas.py routes reads to them),
+# comma separated SQLite files or postgres hosts (host or host:port), everything else is the primary's
+#
+# SQLite has no row locks (select_for_update is a no-op), so transactions take the write lock up front
+# with BEGIN IMMEDIATE and wait on it (the busy timeout) instead of failing when bookings for the same class
+# race each other. the test database is a file too, a shared in-memory database can't wait on a lock
+
+PROFILES = ('sqlite', 'sqlite-wal', 'postgres')
+SQLITE_BUSY_TIMEOUT = 20
+SQLITE_WAL_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA journal_size_limit=67108864',
+)
+
+def conn_max_age(env, default):
+    value = env.get('ZOOMBY_DB_CONN_MAX_AGE')
+    if value is None:
+        return default
+    return None if value.lower() == 'none' else int(value)
+
+def sqlite(base_dir, env, wal):
+    options = {
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': SQLITE_BUSY_TIMEOUT,
+    }
+    if wal:
+        options['init_command'] = ';'.join(SQLITE_WAL_PRAGMAS)
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('ZOOMBY_DB_NAME') or base_dir / 'db.sqlite3',
+        'OPTIONS': options,
+        'CONN_MAX_AGE': conn_max_age(env, 600 if wal else 0),
+        'CONN_HEALTH_CHECKS': wal,
+        'TEST': {
+            'NAME': base_dir / 'test_db.sqlite3',
+        },
+    }
+
+def postgres(env):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('ZOOMBY_DB_NAME', 'zoomby'),
+        'USER': env.get('ZOOMBY_DB_USER', 'zoomby'),
+        'PASSWORD': env.get('ZOOMBY_DB_PASSWORD', ''),
+        'HOST': env.get('ZOOMBY_DB_HOST', 'localhost'),
+        'PORT': env.get('ZOOMBY_DB_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if env.get('ZOOMBY_DB_POOL', '1') == '1':
+        # the pool hands out and checks the connections, django must not keep them itself
+        database['OPTIONS'] = {
+            'pool': {
+                'min_size': int(env.get('ZOOMBY_DB_POOL_MIN', 2)),
+                'max_size': int(env.get('ZOOMBY_DB_POOL_MAX', 10)),
+                'timeout': 10,
+            },
+        }
+        database['CONN_MAX_AGE'] = 0
+    else:
+        database['CONN_MAX_AGE'] = conn_max_age(env, 600)
+    return database
+
+def replicas(primary, env):
+    databases = {}
+    locations = [location.strip() for location in env.get('ZOOMBY_DB_REPLICAS', '').split(',') if location.strip()]
+    for number, location in enumerate(locations, start=1):
+        replica = copy.deepcopy(primary)
+        if primary['ENGINE'] == 'django.db.backends.postgresql':
+            host, _, port = location.partition(':')
+            replica['HOST'] = host
+            replica['PORT'] = port or primary['PORT']
+        else:
+            replica['NAME'] = location
+        # tests have no replication, they read the replicas through the test database
+        replica['TEST'] = {'MIRROR': 'default'}
+        databases[f'replica{number}'] = replica
+    return databases
+
+def database_settings(base_dir, env=os.environ):
+    profile = env.get('ZOOMBY_DB_PROFILE', 'sqlite')
+    if profile == 'postgres':
+        primary = postgres(env)
+    elif profile in ('sqlite', 'sqlite-wal'):
+        primary = sqlite(base_dir, env, wal=profile == 'sqlite-wal')
+    else:
+        raise ImproperlyConfigured(f"Unknown ZOOMBY_DB_PROFILE {profile!r}, expected one of {', '.join(PROFILES)}")
+    return {'default': primary, **replicas(primary, env)}
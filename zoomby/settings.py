@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
+from zoomby.databases import database_settings
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'zoomby.urls'
@@ -75,14 +78,63 @@ WSGI_APPLICATION = 'zoomby.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# ZOOMBY_DB_PROFILE picks sqlite (default), sqlite-wal or postgres, see zoomby/databases.py
 
-DATABASES = {
+DATABASES = database_settings(BASE_DIR)
+
+# reads of the classes, activities and bookings endpoints go to the replicas (core/replicas.py), a client that
+# wrote reads from the primary for REPLICA_PIN_SECONDS, the replication lag it allows for
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_SECONDS = int(os.environ.get('ZOOMBY_REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# local memory by default, point ZOOMBY_CACHE_BACKEND / ZOOMBY_CACHE_LOCATION at a shared backend
+# (redis, memcached) when running more than one process
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('ZOOMBY_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('ZOOMBY_CACHE_LOCATION', 'zoomby'),
     }
 }
 
+# class and activity listings are cached under a version counter that writes bump (core/cache.py),
+# the timeout only bounds how long unused pages stay around
+LISTING_CACHE_ALIAS = 'default'
+LISTING_CACHE_TIMEOUT = 300
+
+# Idempotency-Key dedup for POST /book/ (core/idempotency.py), 'local' is an in-process LRU for a single
+# node, 'cache' stores keys in IDEMPOTENCY_CACHE_ALIAS so every node sees them
+IDEMPOTENCY_STORE = os.environ.get('ZOOMBY_IDEMPOTENCY_STORE', 'local')
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# seconds a key stays in progress before a retry may run it again, longer than a booking request takes
+IDEMPOTENCY_LOCK_TTL = 30
+IDEMPOTENCY_MAX_KEYS = 10000
+
+# live availability stream (core/availability.py), changes within the window are sent as one event, classes
+# are re-read every poll interval to pick up writes from other processes
+AVAILABILITY_STREAM_WINDOW = 0.5
+AVAILABILITY_STREAM_POLL_INTERVAL = 5
+AVAILABILITY_STREAM_HEARTBEAT = 15
+
+
+# per view request metrics on /metrics (core/metrics.py), set ZOOMBY_METRICS_TOKEN to require it as a bearer token.
+# requests slower than ZOOMBY_SLOW_REQUEST_MS are logged with their slowest statements
+METRICS_ENABLED = os.environ.get('ZOOMBY_METRICS', '1') == '1'
+METRICS_TOKEN = os.environ.get('ZOOMBY_METRICS_TOKEN') or None
+SLOW_REQUEST_THRESHOLD = int(os.environ['ZOOMBY_SLOW_REQUEST_MS']) / 1000 if os.environ.get('ZOOMBY_SLOW_REQUEST_MS') else None
+SLOW_REQUEST_MAX_STATEMENTS = 20
+
+
+# account written into created_by / updated_by when a request isn't authenticated (core/actors.py), the first
+# superuser when unset. it is cached per process, a User save or delete drops it
+SERVICE_ACCOUNT_ID = int(os.environ['ZOOMBY_SERVICE_ACCOUNT_ID']) if os.environ.get('ZOOMBY_SERVICE_ACCOUNT_ID') else None
+SERVICE_ACCOUNT_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -103,6 +155,23 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# list endpoints serialize pages from .values() rows instead of model instances (core/fastpath.py), same output
+READ_FAST_PATH = os.environ.get('ZOOMBY_READ_FAST_PATH', '1') == '1'
+
+REST_FRAMEWORK = {
+    # orjson backed JSON when orjson is installed, DRF's own JSONRenderer / JSONParser otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -126,6 +195,10 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # logger setup
+# the file handlers are written by a listener thread (core/logs.py), the request thread only queues the record.
+# request / response payloads in log messages are cut after LOG_PAYLOAD_MAX_LENGTH characters
+
+LOG_PAYLOAD_MAX_LENGTH = 1000
 
 LOGGING = {
     'version': 1,
@@ -140,7 +213,8 @@ LOGGING = {
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
+            'class': 'core.logs.QueuedHandler',
+            'handler_class': 'logging.handlers.RotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'core.log'),
             'maxBytes': 5 * 1024 * 1024,  
             'backupCount': 5,
@@ -148,7 +222,8 @@ LOGGING = {
         },
         'file_django': {
             'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
+            'class': 'core.logs.QueuedHandler',
+            'handler_class': 'logging.handlers.RotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'django.log'),
             'maxBytes': 5 * 1024 * 1024,
             'backupCount': 5,
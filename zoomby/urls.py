@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
+from core.metrics import metrics_view
 
 urlpatterns = [
     path("core/", include("core.urls")),
+    path('metrics', metrics_view, name='metrics'),
     path('admin/', admin.site.urls),
 ]